@@ -89,6 +89,7 @@ ANTHROPIC_CONFIG = { # ...
     'model': os.getenv('CLAUDE_MODEL', 'claude-3-haiku-20240307'),
     'max_tokens': int(os.getenv('CLAUDE_MAX_TOKENS', '8000')),
     'rate_limit_per_minute': int(os.getenv('CLAUDE_RATE_LIMIT_PER_MINUTE', '50')),
+    'tokens_per_minute': int(os.getenv('CLAUDE_TOKENS_PER_MINUTE', '0')), # 0 = no TPM throttle
     'max_retries': int(os.getenv('CLAUDE_MAX_RETRIES', '3'))
 }
 SEARCH_CONSOLE_CONFIG = { # ...
@@ -103,7 +104,9 @@ DATABASE_CONFIG = { # ...
 }
 WORKER_CONFIG = { # ...
     'max_task_retries': 3,
-    'tasks_to_process_per_run': 2
+    'retry_delay_seconds': int(os.getenv('TASK_RETRY_DELAY', '15')), # Before a failed task's retry; doubles per attempt
+    'tasks_to_process_per_run': 2,
+    'concurrency': int(os.getenv('WORKER_CONCURRENCY', '4')) # Tasks processed in parallel per worker process
 }
 
 
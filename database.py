@@ -1,8 +1,14 @@
 import mysql.connector
+from mysql.connector import pooling
+try:
+    import MySQLdb # mysqlclient C driver, used for bulk search_data reads/writes
+except ImportError:
+    MySQLdb = None
 import logging
 import os
 import uuid
 import json
+import threading
 from dotenv import load_dotenv
 from datetime import datetime
 from config import DATABASE_CONFIG # Import config
@@ -22,18 +28,41 @@ DB_CONFIG = {
     'port': 3306 # Default MySQL port
 }
 
+# --- Connection Pools ---
+# Created lazily on first use. Calling close() on a pooled connection returns it to the pool,
+# so callers keep their existing open/close pattern while skipping TCP + auth setup per call.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+_db_pool = None
+_wp_db_pool = None
+_pool_lock = threading.Lock()
+
 def get_db_connection():
-    """Establishes and returns a MySQL database connection."""
+    """Returns a pooled MySQL database connection (close() hands it back to the pool)."""
+    global _db_pool
     if not all([DATABASE_CONFIG.get('host'), DATABASE_CONFIG.get('user'), DATABASE_CONFIG.get('password'), DATABASE_CONFIG.get('database')]):
          log.error("Database configuration is incomplete.")
          return None
     try:
-        conn = mysql.connector.connect(**DATABASE_CONFIG)
+        with _pool_lock:
+            if _db_pool is None:
+                _db_pool = pooling.MySQLConnectionPool(
+                    pool_name="app_pool", pool_size=DB_POOL_SIZE, pool_reset_session=True, **DATABASE_CONFIG
+                )
+                log.info(f"Created MySQL connection pool 'app_pool' (size {DB_POOL_SIZE}).")
+        conn = _db_pool.get_connection()
         if conn.is_connected():
             return conn
         else:
             log.error("Failed to connect to the MySQL database.")
             return None
+    except mysql.connector.errors.PoolError as pool_err:
+        # Every pooled connection is checked out; don't block, open a one-off connection instead
+        log.warning(f"MySQL connection pool exhausted ({pool_err}). Opening a direct connection.")
+        try:
+            return mysql.connector.connect(**DATABASE_CONFIG)
+        except mysql.connector.Error as err:
+            log.error(f"MySQL Connection Error: {err}")
+            return None
     except mysql.connector.Error as err:
         log.error(f"MySQL Connection Error: {err}")
         return None
@@ -41,20 +70,50 @@ def get_db_connection():
          log.error(f"Unexpected error getting DB connection: {e}")
          return None
 
+def get_search_data_connection():
+    """
+    Returns a connection for the bulk search_data reads/writes done by SearchConsoleDataProcessor.
+    Uses the mysqlclient (MySQLdb) C driver when installed, which is much cheaper per row on large
+    result sets; falls back to get_db_connection() (mysql.connector) otherwise.
+    """
+    if MySQLdb is None:
+        return get_db_connection()
+    if not all([DATABASE_CONFIG.get('host'), DATABASE_CONFIG.get('user'), DATABASE_CONFIG.get('password'), DATABASE_CONFIG.get('database')]):
+         log.error("Database configuration is incomplete.")
+         return None
+    try:
+        return MySQLdb.connect(
+            host=DATABASE_CONFIG['host'],
+            user=DATABASE_CONFIG['user'],
+            passwd=DATABASE_CONFIG['password'],
+            db=DATABASE_CONFIG['database'],
+            port=DATABASE_CONFIG.get('port', 3306),
+            charset='utf8mb4'
+        )
+    except MySQLdb.MySQLError as err:
+        log.error(f"MySQL (mysqlclient) Connection Error: {err}")
+        return None
+    except Exception as e:
+         log.error(f"Unexpected error getting search data DB connection: {e}")
+         return None
+
 # First, let's create a WordPress-specific DB connection function in database.py
 
-def get_wordpress_db_connection():
-    """Establishes and returns a connection to the WordPress database."""
+def _whitelist_wordpress_db_ip():
+    """Whitelists this host's IP on Cloudways; needed before opening new WordPress DB sockets."""
     # Import cloudways_ip_whitelist here to avoid circular imports
     from cloudways_ip_whitelist import whitelist_ip_sync
-    
-    # First, attempt to whitelist the IP - this is crucial for Cloudways access
+
     whitelist_result = whitelist_ip_sync()
     if not whitelist_result:
         log.warning("IP whitelisting for Cloudways WordPress DB failed. Connection might fail.")
     else:
         log.info("Successfully whitelisted IP for WordPress database access")
-    
+
+def get_wordpress_db_connection():
+    """Returns a pooled connection to the WordPress database (close() hands it back to the pool)."""
+    global _wp_db_pool
+
     # Get WordPress DB credentials from environment
     wp_db_host = os.getenv('WP_DB_HOST')
     wp_db_user = os.getenv('WP_DB_USER')
@@ -65,21 +124,45 @@ def get_wordpress_db_connection():
     if not all([wp_db_host, wp_db_user, wp_db_password, wp_db_name]):
         log.error("WordPress database configuration is incomplete.")
         return None
+
+    wp_db_config = {
+        'host': wp_db_host,
+        'user': wp_db_user,
+        'password': wp_db_password,
+        'database': wp_db_name,
+        'port': wp_db_port
+    }
     
     try:
-        conn = mysql.connector.connect(
-            host=wp_db_host,
-            user=wp_db_user,
-            password=wp_db_password,
-            database=wp_db_name,
-            port=wp_db_port
-        )
+        with _pool_lock:
+            if _wp_db_pool is None:
+                # Whitelisting is crucial for Cloudways access; only needed when sockets are opened
+                _whitelist_wordpress_db_ip()
+                _wp_db_pool = pooling.MySQLConnectionPool(
+                    pool_name="wp_pool", pool_size=DB_POOL_SIZE, pool_reset_session=True, **wp_db_config
+                )
+                log.info(f"Created WordPress DB connection pool 'wp_pool' at {wp_db_host} (size {DB_POOL_SIZE}).")
+        try:
+            conn = _wp_db_pool.get_connection()
+        except (mysql.connector.errors.InterfaceError, mysql.connector.errors.DatabaseError) as conn_err:
+            # The Cloudways whitelist can expire while the pool lives on; pooled reconnects then
+            # fail (connection refused / access denied) until it's renewed, so renew and retry once
+            log.warning(f"WordPress DB pooled connection failed ({conn_err}). Re-whitelisting IP and retrying once.")
+            _whitelist_wordpress_db_ip()
+            conn = _wp_db_pool.get_connection()
         if conn.is_connected():
-            log.info(f"Successfully connected to WordPress database at {wp_db_host}")
             return conn
         else:
             log.error("Failed to connect to the WordPress database.")
             return None
+    except mysql.connector.errors.PoolError as pool_err:
+        log.warning(f"WordPress DB connection pool exhausted ({pool_err}). Opening a direct connection.")
+        try:
+            _whitelist_wordpress_db_ip()
+            return mysql.connector.connect(**wp_db_config)
+        except mysql.connector.Error as err:
+            log.error(f"WordPress DB Connection Error: {err}")
+            return None
     except mysql.connector.Error as err:
         log.error(f"WordPress DB Connection Error: {err}")
         return None
@@ -121,6 +204,43 @@ def initialize_schema():
                    UNIQUE KEY unique_query_date (query(255), date)
                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
           """)
+          # Per-query rollup of search_data, refreshed at ingest by SearchConsoleDataProcessor.
+          # position_bucket is a stored generated column so distribution queries are an index aggregate.
+          cursor.execute("""
+               CREATE TABLE IF NOT EXISTS search_data_query_summary (
+                   query VARCHAR(512) NOT NULL,
+                   total_impressions BIGINT DEFAULT 0,
+                   total_clicks BIGINT DEFAULT 0,
+                   avg_position DECIMAL(10, 2) DEFAULT 0.00,
+                   position_bucket ENUM('Top 3', 'Top 10', 'Top 20', '20+')
+                       GENERATED ALWAYS AS (
+                           CASE
+                               WHEN avg_position <= 3 THEN 'Top 3'
+                               WHEN avg_position <= 10 THEN 'Top 10'
+                               WHEN avg_position <= 20 THEN 'Top 20'
+                               ELSE '20+'
+                           END
+                       ) STORED,
+                   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                   UNIQUE KEY unique_summary_query (query), -- full column: a prefix key would merge long queries via ODKU
+                   INDEX idx_position_bucket (position_bucket)
+               ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+          """)
+          # Tables created with the old query(255) prefix key: widen it, and drop the (possibly merged)
+          # rows; SearchConsoleDataProcessor.get_position_distribution rebuilds an empty summary
+          cursor.execute("""
+               SELECT SUB_PART FROM INFORMATION_SCHEMA.STATISTICS
+               WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'search_data_query_summary'
+                 AND INDEX_NAME = 'unique_summary_query'
+          """)
+          summary_key = cursor.fetchall()
+          if summary_key and summary_key[0][0] is not None:
+               logging.info("Widening search_data_query_summary key to the full query column.")
+               cursor.execute("DELETE FROM search_data_query_summary")
+               cursor.execute("""
+                    ALTER TABLE search_data_query_summary
+                    DROP INDEX unique_summary_query, ADD UNIQUE KEY unique_summary_query (query)
+               """)
           cursor.execute("""
                CREATE TABLE IF NOT EXISTS background_tasks (
                    task_id VARCHAR(50) PRIMARY KEY,
@@ -133,11 +253,30 @@ def initialize_schema():
                    last_error TEXT NULL
                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
           """)
+          # Callbacks that WordPress didn't accept after in-process retries; redelivered by the worker
+          # so a delivery-only failure never re-runs (and re-bills) the task itself
+          cursor.execute("""
+               CREATE TABLE IF NOT EXISTS pending_callbacks (
+                   id INT AUTO_INCREMENT PRIMARY KEY,
+                   task_id VARCHAR(50) NOT NULL,
+                   callback_url TEXT NOT NULL,
+                   payload JSON,
+                   attempts INT DEFAULT 0,
+                   last_error TEXT NULL,
+                   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+               ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+          """)
           # Add index creation if not included in CREATE TABLE
           cursor.execute("CREATE INDEX IF NOT EXISTS idx_query ON search_data (query(255));")
           cursor.execute("CREATE INDEX IF NOT EXISTS idx_date ON search_data (date);")
           cursor.execute("CREATE INDEX IF NOT EXISTS idx_impressions ON search_data (impressions);")
+          # Covering index for per-query aggregates (get_query_trends); full query column so it can cover
+          cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_agg ON search_data (query, impressions, clicks, position);")
           cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_status ON background_tasks (status);")
+          # Lets claim_next_task read (and lock) rows in created_at order instead of filesorting
+          # every runnable row, which would lock them all and make other workers see an empty queue
+          cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_status_created ON background_tasks (status, created_at);")
 
           conn.commit()
           logging.info("Database schema checked/initialized.")
@@ -224,6 +363,65 @@ def get_pending_tasks(limit=1):
         if cursor: cursor.close()
         if conn and conn.is_connected(): conn.close()
 
+def claim_next_task():
+    """
+    Atomically claims the oldest runnable task: marks it 'processing' and increments attempts in
+    the same transaction. SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8.0+) lets several workers claim
+    concurrently without ever getting the same row. Returns the task dict (with the pre-claim
+    attempts count and 'claimed': True) or None if the queue is empty.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn: return None
+        cursor = conn.cursor(dictionary=True)
+        from config import WORKER_CONFIG # Get max retries
+        max_retries = WORKER_CONFIG.get('max_task_retries', 3)
+        retry_delay = WORKER_CONFIG.get('retry_delay_seconds', 15)
+        conn.start_transaction()
+        # Failed tasks wait retry_delay seconds, doubling per attempt made, before they can be
+        # claimed again (updated_at is written from Python, so compare against Python's clock)
+        cursor.execute("""
+            SELECT task_id, task_type, payload, attempts
+            FROM background_tasks
+            WHERE (status = 'pending'
+                   OR (status = 'error' AND attempts < %s
+                       AND updated_at <= %s - INTERVAL (%s * POW(2, GREATEST(attempts - 1, 0))) SECOND))
+            ORDER BY created_at ASC
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, (max_retries, datetime.now(), retry_delay))
+        task = cursor.fetchone()
+        if not task:
+            conn.rollback()
+            return None
+        cursor.execute("""
+            UPDATE background_tasks
+            SET status = 'processing', attempts = attempts + 1, updated_at = %s
+            WHERE task_id = %s
+        """, (datetime.now(), task['task_id']))
+        conn.commit()
+        if task.get('payload'):
+             try:
+                  task['payload'] = json.loads(task['payload'])
+             except json.JSONDecodeError:
+                  log.warning(f"Could not decode payload for task {task['task_id']}")
+                  task['payload'] = {} # Set to empty dict on error
+        task['claimed'] = True
+        return task
+    except mysql.connector.Error as err:
+        log.error(f"DB Error claiming next task: {err}")
+        if conn: conn.rollback()
+        return None
+    except Exception as e:
+        log.error(f"Error claiming next task: {e}")
+        if conn: conn.rollback()
+        return None
+    finally:
+        if cursor: cursor.close()
+        if conn and conn.is_connected(): conn.close()
+
 def update_task_status(task_id, status, attempts=None, error_message=None):
     """Updates the status, attempts, and optionally error message of a task."""
     conn = None
@@ -262,6 +460,97 @@ def mark_task_processing(task_id, attempts):
      # This helps prevent race conditions if multiple workers run
      return update_task_status(task_id, 'processing', attempts=attempts+1)
 
+# --- Pending Callback Functions ---
+
+def add_pending_callback(task_id, callback_url, payload):
+    """Queues a WordPress callback that could not be delivered, for later redelivery."""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn: return False
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO pending_callbacks (task_id, callback_url, payload) VALUES (%s, %s, %s)",
+            (task_id, callback_url, json.dumps(payload))
+        )
+        conn.commit()
+        log.info(f"Queued callback for task {task_id} for redelivery.")
+        return True
+    except mysql.connector.Error as err:
+        log.error(f"DB Error queueing callback for task {task_id}: {err}")
+        if conn: conn.rollback()
+        return False
+    except Exception as e:
+        log.error(f"Error queueing callback for task {task_id}: {e}")
+        if conn: conn.rollback()
+        return False
+    finally:
+        if cursor: cursor.close()
+        if conn and conn.is_connected(): conn.close()
+
+def get_pending_callbacks(limit=20, max_attempts=20):
+    """Retrieves queued callbacks (oldest first) that haven't exhausted their redelivery attempts."""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn: return []
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT id, task_id, callback_url, payload, attempts
+            FROM pending_callbacks
+            WHERE attempts < %s
+            ORDER BY id ASC
+            LIMIT %s
+        """, (max_attempts, limit))
+        callbacks = cursor.fetchall()
+        for cb in callbacks:
+             try:
+                  cb['payload'] = json.loads(cb['payload']) if cb.get('payload') else {}
+             except json.JSONDecodeError:
+                  log.warning(f"Could not decode queued callback payload {cb['id']}")
+                  cb['payload'] = {}
+        return callbacks
+    except mysql.connector.Error as err:
+        log.error(f"DB Error fetching pending callbacks: {err}")
+        return []
+    except Exception as e:
+        log.error(f"Error fetching pending callbacks: {e}")
+        return []
+    finally:
+        if cursor: cursor.close()
+        if conn and conn.is_connected(): conn.close()
+
+def resolve_pending_callback(callback_id, error_message=None):
+    """Deletes a delivered callback, or records a failed redelivery attempt if error_message is given."""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn: return False
+        cursor = conn.cursor()
+        if error_message is None:
+            cursor.execute("DELETE FROM pending_callbacks WHERE id = %s", (callback_id,))
+        else:
+            cursor.execute(
+                "UPDATE pending_callbacks SET attempts = attempts + 1, last_error = %s WHERE id = %s",
+                (error_message, callback_id)
+            )
+        conn.commit()
+        return cursor.rowcount > 0
+    except mysql.connector.Error as err:
+        log.error(f"DB Error updating pending callback {callback_id}: {err}")
+        if conn: conn.rollback()
+        return False
+    except Exception as e:
+        log.error(f"Error updating pending callback {callback_id}: {e}")
+        if conn: conn.rollback()
+        return False
+    finally:
+        if cursor: cursor.close()
+        if conn and conn.is_connected(): conn.close()
+
 # Add other database utility functions if needed
 
 if __name__ == '__main__':
@@ -74,7 +74,7 @@ def fetch_and_save_gsc_data(days_to_fetch=90, max_rows=25000):
 
         # 5. Initialize Data Processor
         log.info("Initializing SearchConsoleDataProcessor...")
-        data_processor = SearchConsoleDataProcessor(database.get_db_connection)
+        data_processor = SearchConsoleDataProcessor(database.get_search_data_connection)
 
         # 6. Save Data to MySQL
         log.info("Saving fetched data to MySQL database...")
@@ -398,7 +398,8 @@ def analyze_and_create_briefs(max_briefs_to_create=50, min_opportunity_score=15)
             anthropic_max_retries=config.ANTHROPIC_CONFIG['max_retries'],
             content_analyzer=analyzer, # Pass analyzer instance
             imagen_client=imagen_client, # Pass imagen client instance
-            wordpress_service=wp_service # Pass wp service instance
+            wordpress_service=wp_service, # Pass wp service instance
+            anthropic_tpm_limit=config.ANTHROPIC_CONFIG['tokens_per_minute']
         )
         log.info("Services initialized.")
 
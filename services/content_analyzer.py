@@ -1,5 +1,6 @@
 # services/content_analyzer.py
-# Modified to remove scraping functionality
+# Competitor analysis: Google Search for URLs, plus a light fetch of the top pages for
+# word count / headings / FAQ signals (no third-party HTML parser)
 
 import os
 import logging
@@ -27,6 +28,8 @@ except ImportError:
 from nltk.util import ngrams
 # --- End NLTK ---
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
 from typing import List, Dict, Any, Optional, Tuple
 from googleapiclient.discovery import build
 from datetime import datetime
@@ -35,9 +38,50 @@ import config
 
 log = logging.getLogger(__name__)
 
+# Sections derive_content_structure adds on its own; a structure of only these carries no competitor signal
+_BOILERPLATE_SECTIONS = {'Introduction', 'Frequently Asked Questions', 'Conclusion'}
+
+
+class _CompetitorPageParser(HTMLParser):
+    """Collects visible text and h2/h3 headings from one competitor page."""
+
+    SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'nav', 'header', 'footer', 'aside', 'form'}
+    HEADING_TAGS = {'h2', 'h3'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text_parts = []
+        self.headings = []
+        self._skip_depth = 0
+        self._heading = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.HEADING_TAGS and not self._skip_depth:
+            self._heading = []
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            if self._skip_depth: self._skip_depth -= 1
+        elif tag in self.HEADING_TAGS and self._heading is not None:
+            heading = ' '.join(''.join(self._heading).split())
+            if heading: self.headings.append(heading)
+            self._heading = None
+
+    def handle_data(self, data):
+        if self._skip_depth: return
+        self.text_parts.append(data)
+        if self._heading is not None: self._heading.append(data)
+
+
 class ContentAnalyzer:
     """Analyzes competitor content, keywords, and identifies opportunities."""
 
+    COMPETITOR_PAGE_TIMEOUT = 10 # seconds per competitor page
+    COMPETITOR_PAGE_MAX_BYTES = 2_000_000 # Don't read huge pages past this
+    COMPETITOR_PAGE_MIN_WORDS = 200 # Thinner pages are usually blocked / consent / JS-only shells
+
     def __init__(self, analyzer_config: dict, db_connection_func, wordpress_service=None):
         """
         Args:
@@ -57,6 +101,9 @@ class ContentAnalyzer:
         log.debug(f"ContentAnalyzer initialized with KE Key: {'Present' if self.ke_api_key else 'MISSING'}")
         log.debug(f"ContentAnalyzer initialized with Google Search Key: {'Present' if self.google_api_key else 'MISSING'}")
         log.debug(f"ContentAnalyzer initialized with Google CSE ID: {'Present' if self.google_cse_id else 'MISSING'}")
+        # Keep-alive session for competitor page fetches
+        self._page_session = requests.Session()
+        self._page_session.headers.update({'User-Agent': 'Mozilla/5.0 (compatible; SEObot content analysis)'})
         self._initialize_nltk()
         log.info("ContentAnalyzer initialized.")
 
@@ -321,38 +368,94 @@ class ContentAnalyzer:
             logging.error(f"Error getting Google search results for '{keyword}': {str(e)}", exc_info=True)
             return []
 
-    # --- REVISED (No Scraping) analyze_competitor_content ---
+    def _fetch_page_html(self, url: str) -> Optional[str]:
+        """Fetches one competitor page's HTML (capped at COMPETITOR_PAGE_MAX_BYTES), or None."""
+        try:
+            with self._page_session.get(url, timeout=self.COMPETITOR_PAGE_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '')
+                if 'html' not in content_type:
+                    log.debug(f"Skipping non-HTML competitor page {url} ({content_type})")
+                    return None
+                body = response.raw.read(self.COMPETITOR_PAGE_MAX_BYTES, decode_content=True)
+                encoding = response.encoding if 'charset=' in content_type.lower() else 'utf-8'
+            return body.decode(encoding or 'utf-8', errors='replace')
+        except (requests.exceptions.RequestException, LookupError) as e:
+            log.warning(f"Could not fetch competitor page {url}: {e}")
+            return None
+
+    @staticmethod
+    def page_signals_from_html(page_html: str) -> Optional[dict]:
+        """Word count, h2/h3 headings and visible text of one page, or None if it can't be parsed."""
+        parser = _CompetitorPageParser()
+        try:
+            parser.feed(page_html)
+            parser.close()
+        except Exception as e:
+            log.warning(f"Could not parse competitor page: {e}")
+            return None
+        text = '\n'.join(part.strip() for part in parser.text_parts if part.strip())
+        return {'word_count': len(text.split()), 'headings': parser.headings, 'text': text}
+
+    def _fetch_competitor_signals(self, urls: List[str]) -> List[dict]:
+        """Page signals for each URL that could be fetched and has real content, fetched concurrently."""
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(5, len(urls))) as executor:
+            pages = list(executor.map(self._fetch_page_html, urls))
+        signals = [self.page_signals_from_html(page) for page in pages if page]
+        return [s for s in signals if s and s['word_count'] >= self.COMPETITOR_PAGE_MIN_WORDS]
+
     def analyze_competitor_content(self, keyword, num_results=10, min_successful_scrapes=2):
         """
-        Gets URLs only (no scraping) and prepares for AI fallbacks in workflow service.
-        Returns analysis dictionary with URLs but relies on AI fallbacks for structure, etc.
+        Gets the top competitor URLs and reads the first five pages for word count, headings and FAQs.
+
+        The signals are only filled in when at least `min_successful_scrapes` pages were usable;
+        otherwise they stay empty/0 and the workflow service uses its AI fallbacks instead.
         """
         if not keyword:
             log.error("Keyword required")
             return {'error': 'Keyword required'}
 
-        log.info(f"Analyzing competitors for '{keyword}' (URLs only - NO scraping)")
+        log.info(f"Analyzing competitors for '{keyword}'")
 
         urls = self.get_top_ranking_urls(keyword, num_results=num_results)
         if not urls:
             log.warning(f"No URLs for '{keyword}'")
             return {'error': 'No competitor URLs found'}
 
-        # Return analysis results with URLs only
+        example_urls = [url['url'] for url in urls[:5]]
+        pages = self._fetch_competitor_signals(example_urls)
+
+        avg_word_count = 0
+        recommended_length = 0
+        content_structure = []
+        faq_questions = []
+        if len(pages) >= min_successful_scrapes:
+            avg_word_count = int(round(sum(p['word_count'] for p in pages) / len(pages)))
+            recommended_length = min(max(1000, int(round(avg_word_count, -2))), 5000)
+            content_structure = self.derive_content_structure([p['headings'] for p in pages])
+            if sum(1 for h in content_structure if h not in _BOILERPLATE_SECTIONS) < 2:
+                content_structure = [] # Competitors shared no real headings
+            # One snippet per text block, so a question isn't glued to the unpunctuated headings above it
+            faq_questions = self.extract_questions_from_content([line for p in pages for line in p['text'].split('\n')])
+        else:
+            log.info(f"Only {len(pages)} usable competitor page(s) for '{keyword}'; leaving signals to AI fallbacks.")
+
         analysis_result = {
             'keyword': keyword,
-            'avg_word_count': 0,  # To be calculated in WorkflowService via AI
-            'recommended_length': 0,  # To be calculated in WorkflowService via AI
-            'content_structure': [],  # To be provided by AI fallback
-            'faq_questions': [],  # To be provided by AI fallback
-            'example_urls': [url['url'] for url in urls[:5]],  # Keep example URLs
-            'successful_scrape_count': 0,  # Always 0 since we don't scrape
+            'avg_word_count': avg_word_count,  # 0 when too few pages were usable
+            'recommended_length': recommended_length,
+            'content_structure': content_structure,
+            'faq_questions': faq_questions,
+            'example_urls': example_urls,
+            'successful_scrape_count': len(pages),
             'error': None  # No error if processing finishes
         }
 
-        log.info(f"Completed no-scrape competitor analysis for '{keyword}'. Returning URLs only.")
+        log.info(f"Completed competitor analysis for '{keyword}' ({len(pages)}/{len(example_urls)} pages usable, "
+                 f"avg {avg_word_count} words, {len(content_structure)} sections, {len(faq_questions)} FAQs).")
         return analysis_result
-    # --- END REVISED analyze_competitor_content ---
 
     # --- SIMPLIFIED analyze_content_gaps ---
     def analyze_content_gaps(self, query: str, competitor_analysis: dict) -> dict:
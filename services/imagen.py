@@ -24,6 +24,11 @@ try:
 except ImportError:  # pragma: no cover
     genai = None  # handled later
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # stdlib json fallback
+
 log = logging.getLogger(__name__)
 
 
@@ -73,10 +78,19 @@ class ImagenClient:
             "instances": [{"prompt": prompt}],
             "parameters": {"sampleCount": n, "aspectRatio": aspect},
         }
-        r = requests.post(url, json=payload, timeout=90)
+        if orjson is not None:
+            r = requests.post(
+                url,
+                data=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"},
+                timeout=90,
+            )
+        else:
+            r = requests.post(url, json=payload, timeout=90)
         if r.status_code != 200:
             raise RuntimeError(f"REST predict failed: {r.status_code} – {r.text[:200]}")
-        data = r.json()
+        # base64 image payloads are large; orjson parses them without the stdlib overhead
+        data = orjson.loads(r.content) if orjson is not None else r.json()
         return [
             base64.b64decode(inst["bytesBase64Encoded"])
             for inst in data["predictions"]
@@ -1,8 +1,21 @@
 import os
+import sys
+import json
+import time
 import logging
 from datetime import datetime, timedelta
 import pandas as pd
 import mysql.connector
+try:
+    import MySQLdb
+    import MySQLdb.connections # Loaded lazily by mysqlclient; _is_mysqldb needs it before any connect
+    import MySQLdb.cursors
+except ImportError: # mysqlclient is optional; mysql.connector connections still work
+    MySQLdb = None
+try:
+    import orjson # Faster parser for the large (25k-row) searchanalytics payloads
+except ImportError:
+    orjson = None
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow # <--- Need this
 from google.auth.transport.requests import Request # <--- Need this
@@ -11,9 +24,20 @@ from googleapiclient.errors import HttpError
 # Make sure config is imported if needed directly, or passed via __init__
 # from config import GOOGLE_CONFIG # Example if needed directly
 
+# Driver errors caught by SearchConsoleDataProcessor, whichever driver supplied the connection
+DB_ERRORS = (mysql.connector.Error, MySQLdb.MySQLError) if MySQLdb else (mysql.connector.Error,)
+
+def _parse_json_response(resp, content):
+    """googleapiclient postproc that parses the response body with orjson when available."""
+    if not content:
+        return {}
+    return orjson.loads(content) if orjson else json.loads(content)
+
 class SearchConsoleAPI:
     """Handles Google Search Console authentication and basic data fetching."""
 
+    SITES_CACHE_TTL = 600 # Seconds to reuse the sites().list() result in verify_site_access
+
     # Modify __init__ to accept config paths from the main config object
     def __init__(self, client_secrets_file_path, token_file_path, site_url, scopes=['https://www.googleapis.com/auth/webmasters.readonly']):
         self.client_secrets_file = client_secrets_file_path # Use the specific path
@@ -22,6 +46,7 @@ class SearchConsoleAPI:
         self.scopes = scopes
         self.credentials = None
         self.service = None
+        self._sites_cache = None # (fetched_at, [siteUrl, ...]) from the last sites().list() call
         logging.info(f"Initializing SearchConsoleAPI for site: {self.site_url}")
 
     def authenticate(self):
@@ -104,14 +129,22 @@ class SearchConsoleAPI:
             logging.error(f'GSC Authentication failed: {str(e)}', exc_info=True) # Log traceback
             raise # Re-raise other exceptions
 
-    def verify_site_access(self):
-        """Verify access to the configured site URL."""
+    def verify_site_access(self, refresh=False):
+        """Verify access to the configured site URL.
+
+        The authorized sites list is cached for SITES_CACHE_TTL seconds; pass refresh=True
+        to force a new sites().list() call.
+        """
         if not self.service:
             logging.error("Authentication needed before verifying site access.")
             return False
         try:
-            sites = self.service.sites().list().execute()
-            available_sites = [site['siteUrl'] for site in sites.get('siteEntry', [])]
+            if not refresh and self._sites_cache and time.time() - self._sites_cache[0] < self.SITES_CACHE_TTL:
+                available_sites = self._sites_cache[1]
+            else:
+                sites = self.service.sites().list().execute()
+                available_sites = [site['siteUrl'] for site in sites.get('siteEntry', [])]
+                self._sites_cache = (time.time(), available_sites)
             if self.site_url not in available_sites:
                 logging.error(f"Site {self.site_url} not found in GSC account. Available: {available_sites}")
                 return False
@@ -143,10 +176,13 @@ class SearchConsoleAPI:
                 'dataState': 'all' # Fetch all data including fresh data
             }
 
-            response = self.service.searchanalytics().query(
+            api_request = self.service.searchanalytics().query(
                 siteUrl=self.site_url,
                 body=request
-            ).execute()
+            )
+            # Skip the stdlib-json JsonModel parser; non-2xx responses still raise HttpError in execute()
+            api_request.postproc = _parse_json_response
+            response = api_request.execute()
 
             logging.info(f"Fetched {len(response.get('rows', []))} rows from GSC starting at row {start_row}.")
             return response
@@ -163,22 +199,111 @@ class SearchConsoleAPI:
 class SearchConsoleDataProcessor:
     """Handles processing and storing Search Console data into MySQL."""
 
+    # Typed numeric columns for the aggregate result sets. MySQL returns SUM/AVG as
+    # DECIMAL, which pandas would otherwise keep as object columns of Decimal values.
+    NUMERIC_DTYPES = {
+        'total_impressions': 'int64',
+        'total_clicks': 'int64',
+        'query_count': 'int64',
+        'avg_position': 'float32',
+        'avg_ctr': 'float32',
+        'current_position': 'float32',
+        'best_position': 'float32',
+        'worst_position': 'float32',
+        'position_volatility': 'float32',
+    }
+
     def __init__(self, db_connection_func):
         """
         Args:
             db_connection_func (callable): A function that returns a MySQL connection object.
+                Either a MySQLdb (mysqlclient) or a mysql.connector connection is accepted;
+                prefer database.get_search_data_connection for the faster C driver.
         """
         self.get_db_connection = db_connection_func
         logging.info("Initializing SearchConsoleDataProcessor.")
 
-    def _get_connection_cursor(self):
-        """Gets a MySQL connection and cursor."""
+    def _get_connection_cursor(self, buffered=None):
+        """Gets a MySQL connection and cursor.
+
+        Args:
+            buffered (bool, optional): Pass False for read queries that are streamed
+                straight into a DataFrame, so rows are not held in the connector buffer.
+        """
         conn = self.get_db_connection()
         if not conn:
             raise ConnectionError("Failed to establish database connection.")
-        cursor = conn.cursor()
+        if self._is_mysqldb(conn):
+            # MySQLdb picks buffering via the cursor class; SSCursor streams rows from the server
+            cursor = conn.cursor(MySQLdb.cursors.SSCursor) if buffered is False else conn.cursor()
+        else:
+            cursor = conn.cursor() if buffered is None else conn.cursor(buffered=buffered)
         return conn, cursor
 
+    @staticmethod
+    def _is_mysqldb(conn):
+        """True if conn came from the mysqlclient (MySQLdb) driver."""
+        return MySQLdb is not None and isinstance(conn, MySQLdb.connections.Connection)
+
+    def _close_connection(self, conn, cursor):
+        """Closes cursor and connection for either driver (MySQLdb has no is_connected())."""
+        if cursor:
+            cursor.close()
+        if conn and (self._is_mysqldb(conn) or conn.is_connected()):
+            conn.close()
+
+    def _cursor_to_dataframe(self, cursor):
+        """Builds a DataFrame directly from the cursor iterator (no intermediate fetchall() list)."""
+        columns = [c[0] for c in cursor.description]
+        df = pd.DataFrame.from_records(iter(cursor), columns=columns)
+        dtypes = {col: dtype for col, dtype in self.NUMERIC_DTYPES.items() if col in df.columns}
+        if dtypes and not df.empty:
+            df = df.astype(dtypes)
+        return df
+
+    # Using ON DUPLICATE KEY UPDATE handles inserts and updates efficiently
+    SEARCH_DATA_UPSERT = """
+        INSERT INTO search_data (query, date, clicks, impressions, ctr, position)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            clicks = VALUES(clicks),
+            impressions = VALUES(impressions),
+            ctr = VALUES(ctr),
+            position = VALUES(position)
+    """
+    INSERT_CHUNK_SIZE = 5000 # Rows per executemany() batch in save_search_data_pages
+
+    def _prepare_rows(self, gsc_response):
+        """Converts one GSC response page into insert tuples.
+
+        Returns:
+            tuple: (rows, min_date_str, max_date_str); dates are None when the page has no rows.
+        """
+        data_to_insert = []
+        min_date_str = '9999-12-31'
+        max_date_str = '0000-01-01'
+
+        for row in gsc_response.get('rows', []):
+            # (query, date) rows repeat each query once per day and each date once per query;
+            # interning collapses the duplicates into shared str objects
+            query = sys.intern(row['keys'][0])
+            date_str = sys.intern(row['keys'][1])
+            min_date_str = min(min_date_str, date_str)
+            max_date_str = max(max_date_str, date_str)
+
+            data_to_insert.append((
+                query,
+                date_str,
+                row['clicks'],
+                row['impressions'],
+                row['ctr'],
+                row['position']
+            ))
+
+        if not data_to_insert:
+            return data_to_insert, None, None
+        return data_to_insert, min_date_str, max_date_str
+
     def save_search_data(self, gsc_response):
         """Saves fetched GSC data to the MySQL database."""
         if not gsc_response or 'rows' not in gsc_response:
@@ -188,37 +313,10 @@ class SearchConsoleDataProcessor:
         conn = None
         cursor = None
         saved_count = 0
+        data_to_insert = []
         try:
             conn, cursor = self._get_connection_cursor()
-            insert_query = """
-                INSERT INTO search_data (query, date, clicks, impressions, ctr, position)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    clicks = VALUES(clicks),
-                    impressions = VALUES(impressions),
-                    ctr = VALUES(ctr),
-                    position = VALUES(position)
-            """
-            # Using ON DUPLICATE KEY UPDATE handles inserts and updates efficiently
-
-            data_to_insert = []
-            min_date_str = '9999-12-31'
-            max_date_str = '0000-01-01'
-
-            for row in gsc_response['rows']:
-                query = row['keys'][0]
-                date_str = row['keys'][1]
-                min_date_str = min(min_date_str, date_str)
-                max_date_str = max(max_date_str, date_str)
-
-                data_to_insert.append((
-                    query,
-                    date_str,
-                    row['clicks'],
-                    row['impressions'],
-                    row['ctr'],
-                    row['position']
-                ))
+            data_to_insert, min_date_str, max_date_str = self._prepare_rows(gsc_response)
 
             if data_to_insert:
                  # Optional: Delete data for the specific date range first if ON DUPLICATE KEY isn't sufficient
@@ -226,12 +324,13 @@ class SearchConsoleDataProcessor:
                  # cursor.execute(delete_query, (min_date_str, max_date_str))
                  # logging.info(f"Deleted existing data between {min_date_str} and {max_date_str}.")
 
-                cursor.executemany(insert_query, data_to_insert)
-                conn.commit()
+                cursor.executemany(self.SEARCH_DATA_UPSERT, data_to_insert)
                 saved_count = cursor.rowcount # Note: rowcount might be tricky with ON DUPLICATE
+                self._refresh_query_summary(cursor, min_date_str, max_date_str)
+                conn.commit()
                 logging.info(f'Successfully saved/updated {len(data_to_insert)} rows ({saved_count} affected) to MySQL database.')
 
-        except mysql.connector.Error as err:
+        except DB_ERRORS as err:
             logging.error(f"Database error during save: {err}")
             if conn:
                 conn.rollback()
@@ -242,18 +341,124 @@ class SearchConsoleDataProcessor:
                 conn.rollback()
             raise # Re-raise to signal failure
         finally:
-            if cursor:
-                cursor.close()
-            if conn and conn.is_connected():
-                conn.close()
+            self._close_connection(conn, cursor)
         return len(data_to_insert) # Return number attempted
 
+    def save_search_data_pages(self, pages):
+        """
+        Saves several GSC response pages in one transaction with a single final commit.
+
+        Args:
+            pages (iterable): GSC response dicts (e.g. successive startRow pages); may be a generator.
+
+        Returns:
+            int: Number of rows attempted across all pages.
+        """
+        conn = None
+        cursor = None
+        total_rows = 0
+        pending = []
+        min_date_str = None
+        max_date_str = None
+        try:
+            conn, cursor = self._get_connection_cursor()
+            for page in pages:
+                if not page or 'rows' not in page:
+                    continue
+                rows, page_min, page_max = self._prepare_rows(page)
+                if not rows:
+                    continue
+                pending.extend(rows)
+                total_rows += len(rows)
+                min_date_str = page_min if min_date_str is None else min(min_date_str, page_min)
+                max_date_str = page_max if max_date_str is None else max(max_date_str, page_max)
+
+                while len(pending) >= self.INSERT_CHUNK_SIZE:
+                    cursor.executemany(self.SEARCH_DATA_UPSERT, pending[:self.INSERT_CHUNK_SIZE])
+                    del pending[:self.INSERT_CHUNK_SIZE]
+
+            if pending:
+                cursor.executemany(self.SEARCH_DATA_UPSERT, pending)
+
+            if total_rows:
+                self._refresh_query_summary(cursor, min_date_str, max_date_str)
+                conn.commit()
+                logging.info(f'Successfully saved/updated {total_rows} rows across pages in one transaction.')
+            else:
+                logging.warning('No GSC data rows to save.')
+
+        except DB_ERRORS as err:
+            logging.error(f"Database error during paged save: {err}")
+            if conn:
+                conn.rollback()
+            raise # Re-raise to signal failure
+        except Exception as e:
+            logging.error(f'Failed to save paged GSC data to database: {str(e)}')
+            if conn:
+                conn.rollback()
+            raise # Re-raise to signal failure
+        finally:
+            self._close_connection(conn, cursor)
+        return total_rows
+
+    def _refresh_query_summary(self, cursor, min_date_str=None, max_date_str=None):
+        """Recomputes search_data_query_summary rows for queries seen in the given date range.
+
+        Runs on the caller's cursor so it shares the ingest transaction. With no date
+        range, or while the summary is still empty (new table or key migration), every
+        query is rebuilt, so a partial refresh never leaves older queries out.
+        """
+        refresh_query = """
+            INSERT INTO search_data_query_summary (query, total_impressions, total_clicks, avg_position)
+            SELECT
+                query,
+                SUM(impressions),
+                SUM(clicks),
+                AVG(position)
+            FROM search_data
+            {where_clause}
+            GROUP BY query
+            ON DUPLICATE KEY UPDATE
+                total_impressions = VALUES(total_impressions),
+                total_clicks = VALUES(total_clicks),
+                avg_position = VALUES(avg_position)
+        """
+        if min_date_str and max_date_str:
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM search_data_query_summary)")
+            if not cursor.fetchall()[0][0]:
+                logging.info("Query summary table is empty; rebuilding it from all of search_data.")
+                min_date_str = max_date_str = None
+        if min_date_str and max_date_str:
+            where_clause = """
+                WHERE query IN (
+                    SELECT DISTINCT query FROM search_data WHERE date BETWEEN %s AND %s
+                )
+            """
+            cursor.execute(refresh_query.format(where_clause=where_clause), (min_date_str, max_date_str))
+        else:
+            cursor.execute(refresh_query.format(where_clause=""))
+        logging.info(f"Refreshed query summary rows ({cursor.rowcount} affected).")
+
+    def _backfill_query_summary(self, conn, cursor):
+        """Rebuilds an empty search_data_query_summary (new install or key migration) from all of search_data.
+
+        Returns True if rows were rebuilt.
+        """
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM search_data_query_summary), EXISTS(SELECT 1 FROM search_data)")
+        has_summary, has_data = cursor.fetchall()[0] # fetchall: unbuffered cursors must be drained
+        if has_summary or not has_data:
+            return False
+        logging.info("Query summary table is empty; rebuilding it from search_data.")
+        self._refresh_query_summary(cursor)
+        conn.commit()
+        return True
+
     def get_aggregated_data(self, min_impressions=100):
          """Fetches aggregated data from the MySQL database."""
          conn = None
          cursor = None
          try:
-             conn, cursor = self._get_connection_cursor()
+             conn, cursor = self._get_connection_cursor(buffered=False)
              # MySQL uses %s placeholders
              query = """
                  SELECT
@@ -269,22 +474,19 @@ class SearchConsoleDataProcessor:
                  ORDER BY total_impressions DESC
              """
              cursor.execute(query, (min_impressions,))
-             # Fetch data into a pandas DataFrame
-             df = pd.DataFrame(cursor.fetchall(), columns=[i[0] for i in cursor.description])
+             # Stream rows into a pandas DataFrame
+             df = self._cursor_to_dataframe(cursor)
              logging.info(f"Retrieved {len(df)} aggregated queries with >= {min_impressions} impressions.")
              return df
 
-         except mysql.connector.Error as err:
+         except DB_ERRORS as err:
              logging.error(f"Database error fetching aggregated data: {err}")
              return pd.DataFrame() # Return empty DataFrame on error
          except Exception as e:
              logging.error(f"Error fetching aggregated data: {str(e)}")
              return pd.DataFrame()
          finally:
-            if cursor:
-                cursor.close()
-            if conn and conn.is_connected():
-                conn.close()
+             self._close_connection(conn, cursor)
 
     # --- Add other query methods from SearchConsoleAnalyzer, adapting SQL ---
 
@@ -293,92 +495,67 @@ class SearchConsoleDataProcessor:
         conn = None
         cursor = None
         try:
-            conn, cursor = self._get_connection_cursor()
+            conn, cursor = self._get_connection_cursor(buffered=False)
+            # position_bucket is a stored, indexed generated column on the summary table
+            # (filled at ingest; rebuilt here from search_data if it's still empty)
             query = """
                 SELECT
-                    CASE
-                        WHEN avg_position <= 3 THEN 'Top 3'
-                        WHEN avg_position <= 10 THEN 'Top 10'
-                        WHEN avg_position <= 20 THEN 'Top 20'
-                        ELSE '20+'
-                    END as position_range,
+                    position_bucket as position_range,
                     COUNT(*) as query_count
-                FROM (
-                    SELECT
-                        query,
-                        AVG(position) as avg_position
-                    FROM search_data
-                    GROUP BY query
-                ) as avg_pos_subquery
-                GROUP BY position_range
+                FROM search_data_query_summary
+                GROUP BY position_bucket
                 ORDER BY
-                    FIELD(position_range, 'Top 3', 'Top 10', 'Top 20', '20+')
+                    FIELD(position_bucket, 'Top 3', 'Top 10', 'Top 20', '20+')
             """ # Using FIELD for custom sort order in MySQL
             cursor.execute(query)
-            df = pd.DataFrame(cursor.fetchall(), columns=[i[0] for i in cursor.description])
+            df = self._cursor_to_dataframe(cursor)
+            if df.empty and self._backfill_query_summary(conn, cursor):
+                cursor.execute(query)
+                df = self._cursor_to_dataframe(cursor)
             logging.info("Retrieved position distribution data.")
             return df
-        except mysql.connector.Error as err:
+        except DB_ERRORS as err:
             logging.error(f"Database error getting position distribution: {err}")
             return pd.DataFrame()
         except Exception as e:
             logging.error(f'Failed to get position distribution: {str(e)}')
             return pd.DataFrame()
         finally:
-             if cursor: cursor.close()
-             if conn and conn.is_connected(): conn.close()
+            self._close_connection(conn, cursor)
 
     def get_query_trends(self, top_n=20):
         """Analyze query trends over time from MySQL."""
         conn = None
         cursor = None
         try:
-            conn, cursor = self._get_connection_cursor()
+            conn, cursor = self._get_connection_cursor(buffered=False)
+            # Single aggregate over search_data; idx_query_agg (query, impressions, clicks, position)
+            # covers every referenced column, so EXPLAIN should show "Using index" with no temp table.
             # MySQL uses LIMIT clause at the end
             query = """
-                WITH query_stats AS (
-                    SELECT
-                        query,
-                        date,
-                        position,
-                        impressions,
-                        clicks
-                    FROM search_data
-                ),
-                query_metrics AS (
-                    SELECT
-                        query,
-                        AVG(position) as current_position,
-                        SUM(impressions) as total_impressions,
-                        SUM(clicks) as total_clicks,
-                        MIN(position) as best_position,
-                        MAX(position) as worst_position
-                    FROM query_stats
-                    GROUP BY query
-                    HAVING SUM(impressions) >= 20 -- Use SUM(impressions) here
-                )
                 SELECT
                     query,
-                    ROUND(current_position, 2) as current_position,
-                    total_impressions,
-                    total_clicks,
-                    ROUND(best_position, 2) as best_position,
-                    ROUND(worst_position, 2) as worst_position,
-                    ROUND(worst_position - best_position, 2) as position_volatility
-                FROM query_metrics
+                    ROUND(AVG(position), 2) as current_position,
+                    SUM(impressions) as total_impressions,
+                    SUM(clicks) as total_clicks,
+                    ROUND(MIN(position), 2) as best_position,
+                    ROUND(MAX(position), 2) as worst_position,
+                    ROUND(MAX(position) - MIN(position), 2) as position_volatility
+                FROM search_data
+                GROUP BY query
+                HAVING SUM(impressions) >= 20
                 ORDER BY total_impressions DESC
                 LIMIT %s
             """
             cursor.execute(query, (top_n,))
-            df = pd.DataFrame(cursor.fetchall(), columns=[i[0] for i in cursor.description])
+            df = self._cursor_to_dataframe(cursor)
             logging.info(f"Retrieved query trends for top {top_n} queries.")
             return df
-        except mysql.connector.Error as err:
+        except DB_ERRORS as err:
             logging.error(f"Database error getting query trends: {err}")
             return pd.DataFrame()
         except Exception as e:
             logging.error(f'Failed to get query trends: {str(e)}')
             return pd.DataFrame()
         finally:
-            if cursor: cursor.close()
-            if conn and conn.is_connected(): conn.close()
\ No newline at end of file
+            self._close_connection(conn, cursor)
\ No newline at end of file
@@ -1,39 +1,159 @@
 import os
 import logging
+import time
+import itertools
+import functools
+import contextlib
+import threading
+from collections import OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import mysql.connector
 from io import BytesIO
-from urllib.parse import urlparse
-from typing import Optional
+from urllib.parse import urlsplit
+from typing import Optional, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:  # Optional: fall back to requests' in-memory multipart encoding
+    MultipartEncoder = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # stdlib json fallback
 
 # Configure root logger (optional, but fine if kept)
 # Get a specific logger for this module
 log = logging.getLogger(__name__)
 
+# Permalink base per taxonomy (product_* are the common WooCommerce structures)
+TAXONOMY_URL_PREFIX = {
+    'category': 'category',
+    'post_tag': 'tag',
+    'product_cat': 'product-category',
+    'product_tag': 'product-tag',
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _fetch_term_slug(db_connection_func, query: str, term_id: int, taxonomy: str, ttl_bucket: int = 0) -> Optional[str]:
+    """
+    Looks up a term's slug. Module-level (not a method) so lru_cache doesn't hold on to the service.
+
+    (term_id, taxonomy) -> slug rarely changes, so results are memoized per process. Callers pass
+    ttl_bucket (time // TTL) so a long-running worker re-reads each slug once the bucket rolls over;
+    stale buckets simply age out of the LRU. DB failures raise instead of returning, so errors are never cached.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = db_connection_func()
+        if not conn:
+            raise ConnectionError("Failed to get DB connection for term link.")
+
+        # Prepared cursor: server parses the (constant) statement once; can't combine with dictionary=True
+        cursor = conn.cursor(prepared=True)
+        cursor.execute(query, (term_id, taxonomy))
+        result = cursor.fetchone()
+        if not result:
+            return None
+        slug = result[0]
+        return slug.decode('utf-8') if isinstance(slug, (bytes, bytearray)) else slug
+    finally:
+        if cursor: cursor.close()
+        if conn:
+            try: conn.close()
+            except Exception: pass
+
+
+@functools.lru_cache(maxsize=8)
+def _derive_urls(api_url) -> Tuple[Optional[str], str]:
+    """
+    Normalizes the configured API URL into (api_url_base, base_site_url).
+
+    The config URL is fixed per process, so this is memoized and runs once rather than on
+    every WordPressService instantiation.
+    """
+    # --- MODIFICATION START ---
+    # Ensure api_url points to the REST API root, typically ending in /wp-json/
+    if api_url:
+        # Remove trailing slashes and specific namespaces like /wp/v2 if present
+        temp_url = api_url.rstrip('/')
+        if temp_url.endswith('/wp/v2'):
+            api_url_base = temp_url[:-len('/wp/v2')].rstrip('/') # Get the part before /wp/v2
+        elif temp_url.endswith('/wc/v3'):
+             api_url_base = temp_url[:-len('/wc/v3')].rstrip('/') # Get the part before /wc/v3
+        else:
+             # Assume it might already be the root or just needs /wp-json check
+             if not temp_url.endswith('/wp-json'):
+                  # If it doesn't end with /wp-json, log a warning, but proceed
+                  # It's better if the config URL is explicitly the /wp-json URL
+                  log.warning(f"Provided API URL '{api_url}' does not end with /wp-json. Assuming it's the base REST API URL.")
+                  api_url_base = temp_url
+             else:
+                  api_url_base = temp_url # It already ends with /wp-json
+    else:
+        api_url_base = None
+    # --- MODIFICATION END ---
+
+    # Extract base site URL for convenience
+    base_site_url = ""
+    if api_url:
+         try:
+             # Try to intelligently find the part before /wp-json if present
+             if '/wp-json' in api_url:
+                 base_site_url = api_url.split('/wp-json')[0].rstrip('/')
+             else:
+                 # Assume the provided URL might be the base if /wp-json is missing
+                 parsed = urlsplit(api_url)
+                 base_site_url = f"{parsed.scheme}://{parsed.netloc}".rstrip('/')
+             log.info(f"Determined base site URL: {base_site_url}")
+         except Exception as e:
+              log.error(f"Could not parse base site URL from API URL '{api_url}': {e}")
+
+    return api_url_base, base_site_url
+
+# ODKU already reports 0 affected rows when the new value equals the stored one
+TERMMETA_ON_DUPLICATE = " ON DUPLICATE KEY UPDATE meta_value = VALUES(meta_value)"
+
+
+class _TermMetaTxn:
+    """Handle yielded by WordPressService.term_meta_txn(); writes run on one connection, uncommitted."""
+
+    def __init__(self, cursor, sql):
+        self._cursor = cursor
+        self._sql = sql
+        self.rows = []
+
+    def update(self, term_id: int, meta_key: str, meta_value: str):
+        if not term_id or not meta_key:
+            raise ValueError("term_id and meta_key are required for term meta updates.")
+        self._cursor.execute(self._sql, (term_id, meta_key, meta_value))
+        self.rows.append((term_id, meta_key, meta_value))
+
+
 class WordPressService:
+    ENDPOINT_CACHE_MAX = 1024
+    HTTP_POOL_MAXSIZE = 20
+    EXISTS_CACHE_TTL = 300  # seconds
+    TERM_LINK_CACHE_TTL = 3600  # seconds; term slugs change on the scale of days
+    EXISTS_CACHE_MAX = 2048
+    TERM_META_CACHE_MAX = 4096
+
     def __init__(self, api_url, api_user, api_password, db_connection_func=None, wp_db_connection_func=None):
-            # --- MODIFICATION START ---
-        # Ensure api_url points to the REST API root, typically ending in /wp-json/
-        if api_url:
-            # Remove trailing slashes and specific namespaces like /wp/v2 if present
-            temp_url = api_url.rstrip('/')
-            if temp_url.endswith('/wp/v2'):
-                self.api_url_base = temp_url[:-len('/wp/v2')].rstrip('/') # Get the part before /wp/v2
-            elif temp_url.endswith('/wc/v3'):
-                 self.api_url_base = temp_url[:-len('/wc/v3')].rstrip('/') # Get the part before /wc/v3
-            else:
-                 # Assume it might already be the root or just needs /wp-json check
-                 if not temp_url.endswith('/wp-json'):
-                      # If it doesn't end with /wp-json, log a warning, but proceed
-                      # It's better if the config URL is explicitly the /wp-json URL
-                      log.warning(f"Provided API URL '{api_url}' does not end with /wp-json. Assuming it's the base REST API URL.")
-                      self.api_url_base = temp_url
-                 else:
-                      self.api_url_base = temp_url # It already ends with /wp-json
-        else:
-            self.api_url_base = None
-        # --- MODIFICATION END ---
+        """
+        Args:
+            db_connection_func / wp_db_connection_func (callable): Return a MySQL connection per call.
+                These should hand out pooled connections (create the MySQLConnectionPool once and
+                return pool.get_connection(), as database.get_db_connection does) -- the DB methods
+                here call close() after every operation, which returns a pooled connection to the
+                pool instead of tearing down the socket.
+        """
+        self.api_url_base, self.base_site_url = _derive_urls(api_url)
 
         self.api_url = api_url
         self.api_user = api_user
@@ -41,87 +161,200 @@ class WordPressService:
         self.get_db_connection = db_connection_func  # For PythonAnywhere DB
         self.get_wp_db_connection = wp_db_connection_func  # For WordPress DB
         self.auth = (self.api_user, self.api_password)
+        # Resolve the table prefix once and pre-build the SQL so the DB methods don't re-read env per call
+        self._wp_prefix = os.getenv('WP_TABLE_PREFIX', 'wp_')
+        self._sql_upsert_termmeta = f"INSERT INTO {self._wp_prefix}termmeta (term_id, meta_key, meta_value) VALUES "  # + one (%s, %s, %s) per row
+        self._sql_upsert_termmeta_row = self._sql_upsert_termmeta + "(%s, %s, %s)" + TERMMETA_ON_DUPLICATE
+        self._sql_get_term_slug = (
+            f"SELECT t.slug FROM {self._wp_prefix}terms AS t "
+            f"INNER JOIN {self._wp_prefix}term_taxonomy AS tt ON t.term_id = tt.term_id "
+            "WHERE t.term_id = %s AND tt.taxonomy = %s"
+        )
+        # (term_id, meta_key) -> last value successfully written, so repeat writes skip the DB (LRU-bounded)
+        self._term_meta_cache = OrderedDict()
+        self._term_meta_lock = threading.Lock() # The service is shared by concurrent task threads
+
+        # Shared keep-alive session so consecutive REST calls reuse the TCP+TLS connection
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=self.HTTP_POOL_MAXSIZE,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
         if not db_connection_func:
              log.warning("No database connection function provided to WordPressService. DB operations will fail.")
 
-        # Extract base site URL for convenience
-        self.base_site_url = ""
-        if api_url:
-             try:
-                 # Try to intelligently find the part before /wp-json if present
-                 if '/wp-json' in api_url:
-                     self.base_site_url = api_url.split('/wp-json')[0].rstrip('/')
-                 else:
-                     # Assume the provided URL might be the base if /wp-json is missing
-                     parsed = urlparse(api_url)
-                     self.base_site_url = f"{parsed.scheme}://{parsed.netloc}".rstrip('/')
-                 log.info(f"Determined base site URL: {self.base_site_url}")
-             except Exception as e:
-                  log.error(f"Could not parse base site URL from API URL '{api_url}': {e}")
-
         # Validation check
         if not self.api_url_base or not self.api_user or not self.api_password:
             raise ValueError("API URL (pointing to /wp-json/), User, and Password are required for WordPressService.")
 
+        # Endpoint -> full URL, so repeat calls to the same endpoint skip URL assembly
+        self._api_root = self.api_url_base.rstrip('/') + '/'
+        self._endpoint_cache = {}
+        # (rest_base, normalized keyword) -> (exists, checked_at); only real API answers are stored
+        self._exists_cache = OrderedDict()
+        self._exists_lock = threading.Lock() # Guards _exists_cache across concurrent task threads
+
         log.info(f"WordPressService initialized for API base: {self.api_url_base}") # Log the adjusted base
 
+    def close(self):
+        """Closes the pooled HTTP session."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
     def update_term_meta(self, term_id: int, meta_key: str, meta_value: str) -> bool:
         """Updates (or adds) term meta using a direct connection to the WordPress database."""
+        if not term_id or not meta_key:
+            log.error("Cannot update term meta: term_id and meta_key are required.")
+            return False
+        return self.bulk_update_term_meta([(term_id, meta_key, meta_value)])
+
+    def bulk_update_term_meta(self, rows, chunk_size: int = 1000) -> bool:
+        """
+        Upserts many term meta rows in the WordPress database.
+
+        Each chunk is written as one multi-row INSERT ... ON DUPLICATE KEY UPDATE and committed
+        once, so N rows cost N/chunk_size round-trips and commits instead of N. Rows whose value
+        matches what this service last wrote are skipped without touching the DB.
+
+        Args:
+            rows (list): (term_id, meta_key, meta_value) tuples.
+            chunk_size (int): Maximum rows per INSERT statement.
+
+        Returns:
+            bool: True if every chunk was written.
+        """
         if not self.get_wp_db_connection:  # Use WordPress DB connection
             log.error("Cannot update term meta: WordPress database connection function not provided.")
             return False
-        if not term_id or not meta_key:
-            log.error("Cannot update term meta: term_id and meta_key are required.")
+        rows = list(rows)
+        if not rows:
+            return True
+        if any(not term_id or not meta_key for term_id, meta_key, _ in rows):
+            log.error("Cannot update term meta: term_id and meta_key are required for every row.")
             return False
 
+        with self._term_meta_lock:
+            cache = self._term_meta_cache
+            rows = [row for row in rows if cache.get((row[0], row[1]), cache) != row[2]]
+        if not rows:
+            log.debug("Term meta values unchanged since last write; skipping DB update.")
+            return True
+
         conn = None
         cursor = None
         success = False
-        wp_prefix = os.getenv('WP_TABLE_PREFIX', 'wp_')  # Get prefix from env
 
         try:
-            log.info(f"Attempting to update term meta for term_id={term_id}, meta_key='{meta_key}'")
+            log.info(f"Attempting to update {len(rows)} term meta row(s) (first: term_id={rows[0][0]}, meta_key='{rows[0][1]}')")
             conn = self.get_wp_db_connection()  # Use WordPress DB connection
             if not conn:
                 log.error("Failed to get WordPress DB connection for term meta update.")
                 return False
 
-            cursor = conn.cursor()
-
-            # Use INSERT ... ON DUPLICATE KEY UPDATE for atomicity
-            sql = f"""
-                INSERT INTO {wp_prefix}termmeta (term_id, meta_key, meta_value)
-                VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE meta_value = VALUES(meta_value)
-            """
-            cursor.execute(sql, (term_id, meta_key, meta_value))
-            log.debug(f"Executed INSERT/UPDATE for term meta term_id={term_id}, meta_key='{meta_key}'")
-
-            conn.commit()
-            if cursor.rowcount > 0:
-                success = True
-                log.info(f"Successfully updated/inserted term meta for term_id={term_id}, meta_key='{meta_key}' (Rows affected: {cursor.rowcount})")
-            elif cursor.rowcount == 0:
-                success = True
-                log.info(f"Term meta value likely unchanged for term_id={term_id}, meta_key='{meta_key}'.")
-            else:
-                success = False
+            cursor = conn.cursor(prepared=True)
+
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                # Use INSERT ... ON DUPLICATE KEY UPDATE for atomicity; one VALUES tuple per row
+                sql = (
+                    self._sql_upsert_termmeta
+                    + ", ".join(["(%s, %s, %s)"] * len(chunk))
+                    + TERMMETA_ON_DUPLICATE
+                )
+                cursor.execute(sql, list(itertools.chain.from_iterable(chunk)))
+                conn.commit()
+                self._remember_term_meta(chunk)
+                if cursor.rowcount > 0:
+                    log.info(f"Successfully updated/inserted {len(chunk)} term meta row(s) (Rows affected: {cursor.rowcount})")
+                else:
+                    log.info(f"Term meta values likely unchanged for {len(chunk)} row(s).")
+            success = True
 
         except mysql.connector.Error as err:
-            log.error(f"Database error updating term meta for term_id={term_id}, meta_key='{meta_key}': {err}")
+            log.error(f"Database error updating term meta ({len(rows)} row(s), first term_id={rows[0][0]}): {err}")
             if conn: conn.rollback()
+            self._invalidate_term_meta_cache(rows)
             success = False
         except Exception as e:
-            log.error(f"Unexpected error updating term meta for term_id={term_id}, meta_key='{meta_key}': {e}", exc_info=True)
+            log.error(f"Unexpected error updating term meta ({len(rows)} row(s), first term_id={rows[0][0]}): {e}", exc_info=True)
             if conn: conn.rollback()
+            self._invalidate_term_meta_cache(rows)
             success = False
         finally:
             if cursor: cursor.close()
-            if conn and conn.is_connected(): conn.close()
+            # No is_connected() check: it pings the server; close() just returns a pooled conn
+            if conn:
+                try: conn.close()
+                except Exception: pass
 
         return success
 
+    def _remember_term_meta(self, rows):
+        """Records committed (term_id, meta_key, meta_value) rows, evicting the least recently written."""
+        with self._term_meta_lock:
+            cache = self._term_meta_cache
+            for term_id, meta_key, meta_value in rows:
+                cache[(term_id, meta_key)] = meta_value
+                cache.move_to_end((term_id, meta_key))
+            while len(cache) > self.TERM_META_CACHE_MAX:
+                cache.popitem(last=False)
+
+    def _invalidate_term_meta_cache(self, rows):
+        """Drops cached values for rows whose write failed, so the next call retries them."""
+        with self._term_meta_lock:
+            for term_id, meta_key, _ in rows:
+                self._term_meta_cache.pop((term_id, meta_key), None)
+
+    @contextlib.contextmanager
+    def term_meta_txn(self):
+        """
+        Batches several term meta writes into one transaction on one pooled connection.
+
+        Usage:
+            with wp.term_meta_txn() as tx:
+                for key, value in pairs:
+                    tx.update(term_id, key, value)
+
+        Commits on normal exit, rolls back and re-raises on error; the connection is always
+        returned to the pool.
+        """
+        if not self.get_wp_db_connection:
+            raise ConnectionError("Cannot update term meta: WordPress database connection function not provided.")
+        conn = self.get_wp_db_connection()
+        if not conn:
+            raise ConnectionError("Failed to get WordPress DB connection for term meta update.")
+
+        cursor = None
+        tx = None
+        try:
+            cursor = conn.cursor(prepared=True)
+            tx = _TermMetaTxn(cursor, self._sql_upsert_termmeta_row)
+            yield tx
+            conn.commit()
+            self._remember_term_meta(tx.rows)
+            log.info(f"Committed {len(tx.rows)} term meta update(s) in one transaction.")
+        except Exception:
+            log.error("Term meta transaction failed; rolling back.", exc_info=True)
+            try: conn.rollback()
+            except Exception: pass
+            if tx: self._invalidate_term_meta_cache(tx.rows)
+            raise
+        finally:
+            if cursor: cursor.close()
+            try: conn.close()
+            except Exception: pass
+
         # --- NEW: get_term_link ---
     def get_term_link(self, term_id: int, taxonomy: str) -> Optional[str]:
         """Gets the public URL for a taxonomy term using database."""
@@ -135,92 +368,85 @@ class WordPressService:
              log.warning("Base site URL not determined, cannot construct term link.")
              return None
 
-        conn = None
-        cursor = None
         link = None
-        wp_prefix = os.getenv('WP_TABLE_PREFIX', 'wp_')
 
         try:
             log.debug(f"Attempting to get link for term_id={term_id}, taxonomy='{taxonomy}'")
-            conn = self.get_db_connection()
-            if not conn:
-                 log.error("Failed to get DB connection for term link.")
-                 return None
-
-            cursor = conn.cursor(dictionary=True)
-
-            query = f"""
-                SELECT t.slug
-                FROM {wp_prefix}terms AS t
-                INNER JOIN {wp_prefix}term_taxonomy AS tt ON t.term_id = tt.term_id
-                WHERE t.term_id = %s AND tt.taxonomy = %s
-            """
-            cursor.execute(query, (term_id, taxonomy))
-            result = cursor.fetchone()
-
-            if result and result.get('slug'):
-                slug = result['slug']
-                # Construct the URL based on common WordPress structures
-                if taxonomy == 'category':
-                    link = f"{self.base_site_url}/category/{slug}/"
-                elif taxonomy == 'post_tag':
-                    link = f"{self.base_site_url}/tag/{slug}/"
-                elif taxonomy == 'product_cat':
-                     link = f"{self.base_site_url}/product-category/{slug}/" # Common WC structure
-                elif taxonomy == 'product_tag':
-                     link = f"{self.base_site_url}/product-tag/{slug}/" # Common WC structure
-                else:
-                    # Fallback for other custom taxonomies
-                    link = f"{self.base_site_url}/{taxonomy}/{slug}/"
+            slug = _fetch_term_slug(self.get_db_connection, self._sql_get_term_slug, term_id, taxonomy,
+                                    int(time.time() // self.TERM_LINK_CACHE_TTL))
+
+            if slug:
+                # Construct the URL based on common WordPress structures (custom taxonomies use their own name)
+                prefix = TAXONOMY_URL_PREFIX.get(taxonomy, taxonomy)
+                link = f"{self.base_site_url}/{prefix}/{slug}/"
                 log.info(f"Constructed link for term_id={term_id}: {link}")
             else:
                 log.warning(f"Could not find slug for term_id={term_id}, taxonomy='{taxonomy}'. Cannot generate link.")
 
+        except ConnectionError as conn_err:
+            log.error(str(conn_err))
         except mysql.connector.Error as err:
             log.error(f"Database error getting term link for term_id={term_id}: {err}")
         except Exception as e:
             log.error(f"Unexpected error getting term link for term_id={term_id}: {e}", exc_info=True)
-        finally:
-            if cursor: cursor.close()
-            if conn and conn.is_connected(): conn.close()
 
         return link
+
+    @staticmethod
+    def clear_term_link_cache():
+        """Drops memoized term slugs (call after editing or deleting terms in a long-running worker)."""
+        _fetch_term_slug.cache_clear()
     # --- END NEW ---
 
-    def _make_request(self, method, endpoint, params=None, data=None, json_data=None, files=None, headers=None):
-        """Helper function to make authenticated requests to the WP REST API."""
+    def _make_request(self, method, endpoint, params=None, data=None, json_data=None, files=None, headers=None,
+                      response_headers=None):
+        """Helper function to make authenticated requests to the WP REST API.
+
+        If a dict is passed as `response_headers`, it is filled with the response headers on success
+        (e.g. X-WP-Total / X-WP-TotalPages for paginated collections).
+        """
         # --- MODIFICATION START ---
         # Expect endpoint to include the namespace, e.g., "wp/v2/posts" or "wc/v3/products/categories"
         if not self.api_url_base:
              log.error("Cannot make request: WordPress API base URL is not configured.")
              return None
 
-        url = f"{self.api_url_base}/{endpoint.lstrip('/')}"
+        url = self._endpoint_cache.get(endpoint)
+        if url is None:
+            if len(self._endpoint_cache) >= self.ENDPOINT_CACHE_MAX:
+                self._endpoint_cache.clear() # Per-ID endpoints (posts/123) would otherwise grow it forever
+            url = self._endpoint_cache.setdefault(endpoint, self._api_root + endpoint.lstrip('/'))
         # --- MODIFICATION END ---
 
         req_headers = headers if headers else {}
         if json_data and 'Content-Type' not in req_headers:
              req_headers['Content-Type'] = 'application/json'
+        if json_data is not None and orjson is not None:
+             # Pre-serialize with orjson (post bodies carry large HTML) instead of requests' json.dumps
+             req_headers.setdefault('Content-Type', 'application/json')
+             data = orjson.dumps(json_data)
+             json_data = None
 
         log.debug(f"Making WP Request: {method} {url}")
 
         try:
-            response = requests.request(
+            response = self.session.request( # Session carries auth and pooled connections
                 method,
                 url,
                 params=params,
                 data=data,
                 json=json_data,
                 files=files,
-                auth=self.auth,
                 headers=req_headers,
                 timeout=30
             )
             response.raise_for_status()
+            if response_headers is not None:
+                 response_headers.update(response.headers)
             if response.content:
                  # Check for JSON content type before decoding
                  if 'application/json' in response.headers.get('Content-Type', ''):
-                     return response.json()
+                     return orjson.loads(response.content) if orjson is not None else response.json()
                  else:
                      log.warning(f"Received non-JSON response from {url}. Status: {response.status_code}. Content-Type: {response.headers.get('Content-Type')}")
                      return response.text # Return text if not JSON
@@ -234,7 +460,7 @@ class WordPressService:
              try:
                    if e.response is not None and e.response.content:
                        if 'application/json' in e.response.headers.get('Content-Type', ''):
-                           error_content = e.response.json()
+                           error_content = orjson.loads(e.response.content) if orjson is not None else e.response.json()
                        else:
                            error_content = e.response.text
              except Exception: # Broad exception during error handling
@@ -255,10 +481,19 @@ class WordPressService:
         """Uploads an image to the WordPress Media Library."""
         endpoint = 'wp/v2/media' # Prepend namespace
         image_data.seek(0)
-        files = {'file': (filename, image_data, 'image/jpeg')}
-        img_data = {'title': title, 'alt_text': title, 'caption': title}
         log.info(f"Uploading image '{filename}' to WordPress...")
-        response_data = self._make_request('POST', endpoint, data=img_data, files=files)
+        if MultipartEncoder is not None:
+            # Stream the multipart body from the BytesIO instead of building it in memory
+            encoder = MultipartEncoder(fields={
+                'file': (filename, image_data, 'image/jpeg'),
+                'title': title, 'alt_text': title, 'caption': title,
+            })
+            response_data = self._make_request('POST', endpoint, data=encoder,
+                                               headers={'Content-Type': encoder.content_type})
+        else:
+            files = {'file': (filename, image_data, 'image/jpeg')}
+            img_data = {'title': title, 'alt_text': title, 'caption': title}
+            response_data = self._make_request('POST', endpoint, data=img_data, files=files)
         if response_data and isinstance(response_data, dict) and 'id' in response_data: # Check type before accessing 'id'
             log.info(f"Image uploaded successfully. Attachment ID: {response_data['id']}")
             return response_data['id']
@@ -266,6 +501,12 @@ class WordPressService:
             log.error(f"Failed to upload image. Response: {response_data}")
             return None
 
+    def delete_media(self, attachment_id) -> bool:
+        """Permanently deletes a Media Library attachment (media has no trash, so force=true)."""
+        endpoint = f'wp/v2/media/{attachment_id}' # Prepend namespace
+        log.info(f"Deleting media attachment ID: {attachment_id}")
+        return self._make_request('DELETE', endpoint, params={'force': 'true'}) is not None
+
     def create_post(self, post_data, rest_base):
         """Creates a new post using its REST base."""
         if not rest_base:
@@ -274,7 +515,13 @@ class WordPressService:
         endpoint = f'wp/v2/{rest_base}' # Prepend default namespace
         log.info(f"Attempting to create WordPress content via REST base '{rest_base}' with title: {post_data.get('title', 'Untitled')}")
         log.debug(f"Using endpoint: {endpoint}") # Log the full endpoint path
-        return self._make_request('POST', endpoint, json_data=post_data)
+        result = self._make_request('POST', endpoint, json_data=post_data)
+        if result:
+            # New content may match keywords cached as "not found" for this rest_base
+            with self._exists_lock:
+                for key in [k for k in self._exists_cache if k[0] == rest_base]:
+                    del self._exists_cache[key]
+        return result
 
     # --- update_post uses rest_base ---
     def update_post(self, post_id, update_data, rest_base): # Use rest_base
@@ -289,14 +536,81 @@ class WordPressService:
         endpoint = f'wp/v2/{rest_base}/{post_id}' # Prepend default namespace
         return self._make_request('GET', endpoint)
 
+    def get_posts_many(self, post_ids, rest_base, max_workers: int = 8) -> list:
+        """Retrieves several posts by ID concurrently; results are in post_ids order (None on failure)."""
+        calls = [('GET', f'wp/v2/{rest_base}/{post_id}', {}) for post_id in post_ids]
+        return self._make_requests_parallel(calls, max_workers=max_workers)
+
+    def _make_requests_parallel(self, calls, max_workers: int = 8) -> list:
+        """
+        Runs independent _make_request calls concurrently over the shared session.
+
+        Args:
+            calls (list): (method, endpoint, kwargs) tuples; kwargs go to _make_request.
+            max_workers (int): Thread count, capped at the session's connection pool size.
+
+        Returns:
+            list: One result per call, in the same order as `calls`.
+        """
+        calls = list(calls)
+        if len(calls) <= 1:
+            return [self._make_request(method, endpoint, **kwargs) for method, endpoint, kwargs in calls]
+
+        workers = min(max_workers, self.HTTP_POOL_MAXSIZE, len(calls))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda call: self._make_request(call[0], call[1], **call[2]), calls))
+
     # --- check_content_exists uses rest_base ---
     def check_content_exists(self, keyword, rest_base): # Use rest_base
         """Checks if content related to a keyword already exists via REST base."""
-        endpoint = f'wp/v2/{rest_base}' # Prepend default namespace
-        params = {'search': keyword, 'per_page': 1, '_fields': 'id,title', 'status': 'any'}
-        log.debug(f"Checking existence for keyword '{keyword}' via REST base '{rest_base}' using endpoint '{endpoint}'")
-        results = self._make_request('GET', endpoint, params=params)
+        return self.check_content_exists_bulk([keyword], rest_base).get(keyword, False)
 
+    def check_content_exists_many(self, keywords, rest_base, max_workers: int = 8) -> List[bool]:
+        """Like check_content_exists_bulk, but returns one bool per input keyword, in order."""
+        found = self.check_content_exists_bulk(keywords, rest_base, max_workers=max_workers)
+        return [found[kw] for kw in keywords]
+
+    def check_content_exists_bulk(self, keywords: List[str], rest_base, max_workers: int = 8) -> Dict[str, bool]:
+        """
+        Checks many keywords against a REST base and returns {keyword: exists}.
+
+        Runs one `search` request per unique keyword, concurrently over the pooled session,
+        so N checks cost roughly N / max_workers round-trips of wall time instead of N.
+        WP's `search` also matches post content, so a local title index would not be equivalent.
+        """
+        endpoint = f'wp/v2/{rest_base}' # Prepend default namespace
+        unique_keywords = list(dict.fromkeys(keywords))
+        found = {}
+        now = time.time()
+        with self._exists_lock:
+            for keyword in unique_keywords:
+                cached = self._exists_cache.get((rest_base, keyword.strip().lower()))
+                if cached is not None and now - cached[1] < self.EXISTS_CACHE_TTL:
+                    found[keyword] = cached[0]
+
+        to_check = [kw for kw in unique_keywords if kw not in found]
+        calls = []
+        for keyword in to_check:
+            params = {'search': keyword, 'per_page': 1, '_fields': 'id,title', 'status': 'any'}
+            log.debug(f"Checking existence for keyword '{keyword}' via REST base '{rest_base}' using endpoint '{endpoint}'")
+            calls.append(('GET', endpoint, {'params': params}))
+
+        results = self._make_requests_parallel(calls, max_workers=max_workers)
+        checked_at = time.time()
+        for keyword, res in zip(to_check, results):
+            found[keyword] = self._content_exists_from_results(keyword, rest_base, res)
+        with self._exists_lock:
+            for keyword, res in zip(to_check, results):
+                if res is not None: # Don't cache failed calls
+                    key = (rest_base, keyword.strip().lower())
+                    self._exists_cache[key] = (found[keyword], checked_at)
+                    self._exists_cache.move_to_end(key)
+            while len(self._exists_cache) > self.EXISTS_CACHE_MAX:
+                self._exists_cache.popitem(last=False)
+        return found
+
+    def _content_exists_from_results(self, keyword, rest_base, results) -> bool:
+        """Interprets one REST `search` response for check_content_exists_bulk."""
         if results is None:
              log.warning(f"API call failed or returned None while checking existence for '{keyword}' via REST base '{rest_base}'. Assuming not found.") # Update log message
              return False
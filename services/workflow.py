@@ -2,19 +2,39 @@ import os
 import logging
 import time
 import json
+import asyncio
+import aiohttp
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import re
+import string
 from datetime import datetime
 import anthropic
 import random
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 import pandas as pd
 import numpy as np
 import requests
-from collections import Counter
 from urllib.parse import urlparse
-import difflib # <-- Import difflib for fuzzy matching
+import difflib # <-- Import difflib for fuzzy matching (fallback when rapidfuzz is missing)
 import html
 from io import BytesIO
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # stdlib json fallback
+
+try:
+    from rapidfuzz import process as rf_process, fuzz as rf_fuzz
+except ImportError:
+    rf_process = rf_fuzz = None  # difflib fallback in _fuzzy_match_category
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None  # AI fallback results just aren't cached
 
 
 # Assuming other services are imported
@@ -38,13 +58,125 @@ def safe_get(data, key, default=None):
 
 log = logging.getLogger(__name__)
 
+# AI response parsing patterns (compiled once; used on every brief)
+_JSON_OBJ_RE = re.compile(r'\{.*\}', re.DOTALL)
+_JSON_ARR_RE = re.compile(r'\[.*\]', re.DOTALL)
+_WC_RE = re.compile(r'\b(\d{3,4})\b')
+
+_WS_RE = re.compile(r'\s+')
+_WORD_RE = re.compile(r'\S+') # Same tokens as str.split(), counted without building the list
+
+def _word_count(text: str) -> int:
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+AI_FALLBACK_CACHE_TTL = 7 * 24 * 3600 # seconds
+# Shared by every generate_content_brief call (structure / FAQs / word count run concurrently),
+# so briefs don't spin up and abandon a pool each; the Anthropic buckets still pace the calls
+_ai_fallback_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ai-fallback')
+KE_CACHE_TTL = 30 * 24 * 3600 # PASF / Related change over weeks, and every call costs credits
+
+# Prompt cleanup: strip each line's edges, then drop blank lines (two C-level passes, no per-line list)
+_PROMPT_CLEAN_EDGES = re.compile(r'(?m)^[^\S\n]+|[^\S\n]+$')
+_PROMPT_CLEAN_BLANKS = re.compile(r'\n{2,}')
+# Claude's link opportunity markers: <span class="link-opportunity" data-link-suggestion="...">anchor</span>
+_LINK_SUGGESTION_RE = re.compile(r'<span class="link-opportunity" data-link-suggestion="([^"]+)">([^<]+)</span>')
+# Same output as html.escape(s, quote=True), as a single str.translate pass
+_HTML_ESCAPE_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'})
+# Cross-links between a dual-content category description and its blog post (kw/url are HTML-escaped by callers)
+_BLOG_REF_TMPL = '<p>Learn more about {kw} in our <a href="{url}" class="category-blog-link" data-keyword="{kw}">detailed guide</a>.</p>'
+_CATEGORY_REF_TMPL = '<p>Explore our full collection of <a href="{url}">{kw}</a> at Cave Supplies.</p>\n\n'
+
+# --- Claude article prompt fragments ---
+# Constant shells hoisted out of _generate_claude_prompt; per call only the $-slots are substituted.
+_DUAL_INSTR_TMPL = string.Template("""
+Special Formatting Instructions for Dual Content:
+Please format your response with clear separation between the two content pieces:
+
+=== CATEGORY DESCRIPTION ===
+[Category description content here - 350-${category_word_limit} words]
+
+=== BLOG POST ===
+[Full blog post content here - target word count as specified (${target_word_count} words)]
+
+For the category description:
+- Focus on helping shoppers make purchase decisions
+- Mention key benefits and features of our products
+- Include a brief "Learn more about [${keyword}] in our detailed guide: [BLOG TITLE]" at the end (replace bracketed terms)
+
+For the blog post:
+- Create comprehensive, educational content
+- Include a "Shop our collection of [${keyword}] at Cave Supplies" with a reference to the category (replace bracketed term)
+- Focus on answering common questions and providing value
+""")
+
+_BRAND_CONTEXT = """
+Brand Voice and Context:
+- Website: Cave Supplies - online retailer of man cave furniture and home decor (bars, game rooms, home theaters, offices).
+- Target Audience: Men personalizing smaller spaces, or those whose partners manage main home decor. Focus on versatility and space-efficiency.
+- Mascot (Optional): Thorak, a prehistoric caveman amazed by modern comforts (use sparingly for humor, simple broken sentences: "Thorak like sturdy stool.").
+- Tone: Authoritative but approachable and relatable for the target audience. We sell premium products, so avoid overly casual or slang language. Focus on quality, features, benefits, and helping the user create their ideal space.
+"""
+
+_KEYWORD_USAGE_TMPL = string.Template("""
+Keyword Usage Instructions & Internal Linking:
+- **Strict Relevance Required:** Your primary goal is to create the best possible article about **"${keyword}"**.
+- **Evaluate Provided Keywords:** Below are keyword lists derived from competitor analysis (what they rank for), user searches (PASF), and related topics. YOU MUST EVALUATE these lists critically.
+- **INCLUDE ONLY TOPICALLY RELEVANT KEYWORDS** that directly relate to **"${keyword}"** and fit naturally within the article's context.
+- **EXCLUDE / IGNORE:**
+    - **Competitor Brand Names:** Absolutely do not mention competitor brands like Wayfair, Amazon, Etsy, Overstock, IKEA, Target, Walmart, Home Depot, Lowes, etc..
+    - **Generic/Navigational Terms:** Ignore terms like 'login', 'near me', 'store', 'customer service', 'free shipping', 'sale', 'discount', 'clearance', 'coupon', 'location', 'reviews' .
+    - **Clearly Unrelated Topics:** Disregard keywords about unrelated product categories (e.g., if the topic is 'bar stools', ignore 'dog ramps', 'rugs', 'carpets', 'outdoor pools', 'kitchen appliances', 'sweater dressers', 'bedding', 'sofas' unless it's a 'sofa bed'). Use common sense to determine relevance to the main topic: **"${keyword}"**. If a term seems borderline, err on the side of *not* including it if it distracts from the main topic.
+    - **Poor Quality/Gibberish:** Ignore any keywords that look like errors, code snippets, or are nonsensical.
+- **Natural Integration:** Weave the *relevant* selected keywords naturally into the text. Avoid forcing keywords or creating unnatural sentences (keyword stuffing). Prioritize using the Primary list keywords most often.
+    - **Internal Link Suggestions:** As you write, identify 8-12 opportunities for internal links (product categories, related products, specific features). Format these suggestions EXACTLY as follows, replacing the placeholder text:
+    `<span class="link-opportunity" data-link-suggestion="Describe the ideal target page here">exact phrase to link</span>`
+- **Example Link Suggestions:**
+    - `...check out our collection of <span class="link-opportunity" data-link-suggestion="Product category page for wooden bar stools">wooden bar stools</span> for a classic look.`
+    - `...consider <span class="link-opportunity" data-link-suggestion="Product category page for swivel bar stools">swivel functionality</span> if you need flexibility.`
+""")
+
+_CONTENT_GUIDELINES_TMPL = string.Template("""
+Content & Formatting Guidelines:
+- Write comprehensive, valuable, and engaging content focused on **"${keyword}"**. Ensure factual accuracy.
+- Use proper HTML: <h2> for main sections (aim for 8-10+ sections to achieve the target word count), <h3> for subsections, <p> for paragraphs, <ul>/<li> for lists, <strong>/<em> for emphasis where appropriate.
+- DO NOT include an H1 title tag. Start content directly with the first `<h2>` tag.
+- Structure content logically using the suggested outline below as a guide, but feel free to adapt it if necessary for quality and flow.
+- Use short paragraphs (generally 2-4 sentences) and bullet points for better readability.
+- Include a compelling Introduction that hooks the reader and a strong Conclusion that summarizes key takeaways.
+- Address relevant FAQs from the list below, ideally in a dedicated FAQ section near the end using H3 for each question.
+- Maintain the Cave Supplies brand voice (authoritative, knowledgeable, helpful, slightly informal but professional, aimed at men building their personal space).
+- Mention "Cave Supplies" only minimally (1-2 times max), perhaps in the conclusion as a call to action (e.g., "Explore the collection at Cave Supplies").
+- **Word Count:** The final output MUST be **EXACTLY ${target_word_count} words**. Count your words carefully before finishing. If you are under the word count, expand on existing points with more detail, examples, or explanations rather than adding filler.
+""")
+
+@lru_cache(maxsize=32)
+def _prompt_skeleton(target_word_count, category_word_limit, is_dual_content: bool):
+    """(content guidelines, dual-content instructions or None) with the numeric fields filled in; only $keyword is left."""
+    guidelines = string.Template(_CONTENT_GUIDELINES_TMPL.safe_substitute(target_word_count=target_word_count))
+    dual_instr = None
+    if is_dual_content:
+        dual_instr = string.Template(_DUAL_INSTR_TMPL.safe_substitute(category_word_limit=category_word_limit, target_word_count=target_word_count))
+    return guidelines, dual_instr
+
+# orjson when available (accepts str or bytes; its decode error subclasses json.JSONDecodeError)
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+if orjson is not None:
+    def _json_dumps(obj) -> str:
+        """json.dumps(obj, default=str) via orjson (non-str dict keys allowed, as the stdlib does)."""
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+else:
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, default=str)
+
 class ContentWorkflowService:
     """Handles the content generation and posting workflow steps."""
 
     def __init__(self, anthropic_api_key, anthropic_model, anthropic_max_tokens, anthropic_rate_limit, anthropic_max_retries,
                  content_analyzer: ContentAnalyzer,
                  imagen_client: ImagenClient,
-                 wordpress_service: WordPressService):
+                 wordpress_service: WordPressService,
+                 anthropic_tpm_limit: int = 0):
         self.analyzer = content_analyzer
         self.imagen_client = imagen_client
         self.wp_service = wordpress_service
@@ -53,7 +185,21 @@ class ContentWorkflowService:
         self.claude_max_tokens = anthropic_max_tokens
         self.rate_limit_per_minute = anthropic_rate_limit
         self.max_retries = anthropic_max_retries
-        self.last_request_time = 0
+        # Token buckets (requests/min and tokens/min); calls only wait when a bucket is empty.
+        # anthropic_tpm_limit = 0 disables the tokens/min bucket.
+        self._rpm_max = float(self.rate_limit_per_minute) if self.rate_limit_per_minute and self.rate_limit_per_minute > 0 else 60.0
+        self._tpm_max = float(anthropic_tpm_limit or 0)
+        self._rpm_bucket = self._rpm_max
+        self._tpm_bucket = self._tpm_max
+        self._last_refill = time.time()
+        self._rate_lock = threading.Lock() # AI fallbacks call Claude from several threads
+        self._cat_lookup_cache = {} # id(categories list) -> (list, {normalized name: category})
+        self._cat_cache: Dict[str, Tuple[float, List[Dict]]] = {} # taxonomy -> (fetched_at, terms)
+        self._cat_mapping_cache: Optional[Tuple[float, Dict[str, Dict]]] = None # (built_at, product_cat link mapping)
+        self._category_soa_cache = None # (mapping, struct-of-arrays view) for _fuzzy_match_category
+        # Disk-backed caches: per-keyword AI fallbacks (structure / FAQs / word count) and KE PASF / Related
+        self._ai_cache = self._open_disk_cache(os.getenv('AI_FALLBACK_CACHE_DIR', '.cache/ai_fallbacks'))
+        self._ke_cache = self._open_disk_cache(os.getenv('KE_CACHE_DIR', '.cache/ke'))
         self.anthropic_client = None
         if self.anthropic_api_key:
             try:
@@ -68,6 +214,23 @@ class ContentWorkflowService:
         if not self.ke_api_key:
             log.warning("KE API Key not found in analyzer config. KE calls disabled.")
 
+        # KE token bucket (requests/sec); shrinks and honors Retry-After when KE answers 429,
+        # then climbs back toward KE_RATE_PER_SEC while KE stays quiet
+        self._ke_rate = self.KE_RATE_PER_SEC
+        self._ke_rate_changed = time.time()
+        self._ke_bucket = self._ke_rate
+        self._ke_last_refill = time.time()
+        self._ke_blocked_until = 0.0
+        self._ke_lock = threading.Lock()
+
+        # Keep-alive session for sync KE calls: one TCP+TLS handshake instead of one per request
+        self._ke_session = requests.Session()
+        self._ke_session.headers.update({
+            'Accept': 'application/json',
+            'Authorization': f'Bearer {self.ke_api_key}'
+            # KE uses form data, requests handles Content-Type
+        })
+
     def _build_image_prompt(self, keyword: str, snippet: str | None = None) -> str:
         """
         Build a one‑liner prompt for Imagen:
@@ -90,23 +253,86 @@ class ContentWorkflowService:
             base += " " + snippet.strip()
         return base
 
-    def _apply_rate_limiting(self):
-        """Apply rate limiting for Claude API calls."""
+    def _refill_rate_buckets(self):
+        """Tops up the RPM/TPM buckets for the time elapsed since the last refill."""
+        now = time.time()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._rpm_bucket = min(self._rpm_max, self._rpm_bucket + elapsed * self._rpm_max / 60.0)
+        if self._tpm_max:
+            self._tpm_bucket = min(self._tpm_max, self._tpm_bucket + elapsed * self._tpm_max / 60.0)
+
+    def _apply_rate_limiting(self, estimated_tokens: int = 0):
+        """
+        Token-bucket rate limiting for Claude API calls.
+
+        Waits only when the requests/min bucket (or tokens/min bucket, if configured) can't cover
+        this call; estimated_tokens is roughly len(prompt) // 4 + max_tokens.
+        """
         if not self.anthropic_client: return
-        try:
-             min_interval = 60.0 / self.rate_limit_per_minute
-             # Handle potential division by zero if rate limit is 0
-             if min_interval <= 0: min_interval = 1.0 # Default minimum interval
-        except ZeroDivisionError:
-             min_interval = 1.0
-
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < min_interval:
-            wait_time = min_interval - time_since_last
+        with self._rate_lock:
+            self._refill_rate_buckets()
+
+            wait_time = 0.0
+            if self._rpm_bucket < 1:
+                wait_time = (1 - self._rpm_bucket) * 60.0 / self._rpm_max
+            tokens_needed = min(float(estimated_tokens), self._tpm_max) if self._tpm_max else 0.0
+            if tokens_needed and self._tpm_bucket < tokens_needed:
+                wait_time = max(wait_time, (tokens_needed - self._tpm_bucket) * 60.0 / self._tpm_max)
+
+            # Reserve now (buckets may go negative); concurrent callers then queue behind this one
+            self._rpm_bucket -= 1
+            self._tpm_bucket -= tokens_needed
+
+        if wait_time > 0:
             log.info(f"Rate limiting: waiting {wait_time:.2f} seconds")
             time.sleep(wait_time)
-        self.last_request_time = time.time()
+
+    # --- KE throttling ---
+    KE_RATE_PER_SEC = 10.0
+    KE_RATE_RECOVERY_SECS = 30.0  # quiet period (no 429) per additive step back up
+    KE_RATE_RECOVERY_STEP = 1.0  # req/s regained per quiet period
+
+    def _ke_reserve(self) -> float:
+        """Takes one token from the KE bucket; returns how long the caller must wait before sending."""
+        with self._ke_lock:
+            now = time.time()
+            if self._ke_rate < self.KE_RATE_PER_SEC:
+                steps = int((now - self._ke_rate_changed) // self.KE_RATE_RECOVERY_SECS)
+                if steps:
+                    self._ke_rate = min(self.KE_RATE_PER_SEC, self._ke_rate + steps * self.KE_RATE_RECOVERY_STEP)
+                    self._ke_rate_changed += steps * self.KE_RATE_RECOVERY_SECS
+            self._ke_bucket = min(self._ke_rate, self._ke_bucket + (now - self._ke_last_refill) * self._ke_rate)
+            self._ke_last_refill = now
+            wait_time = max(0.0, (1 - self._ke_bucket) / self._ke_rate, self._ke_blocked_until - now)
+            self._ke_bucket -= 1
+            return wait_time
+
+    @staticmethod
+    def _anthropic_rate_limit_wait(error, retries: int) -> float:
+        """Seconds to wait after an Anthropic 429: the server's retry-after if given, else a short jittered backoff."""
+        server_wait = 0.0
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                server_wait = float(response.headers.get('retry-after', 0) or 0)
+            except (TypeError, ValueError):
+                server_wait = 0.0
+        return max(server_wait, (2 ** retries) + random.uniform(0, 1))
+
+    def _ke_rate_limited(self, retry_after: Optional[str]):
+        """KE returned 429: halve the bucket rate (recovered in _ke_reserve) and pause all KE calls for Retry-After seconds."""
+        try:
+            delay = float(retry_after) if retry_after else 1.0
+        except ValueError:
+            delay = 1.0
+        with self._ke_lock:
+            self._ke_rate = max(1.0, self._ke_rate / 2)
+            self._ke_rate_changed = time.time()
+            self._ke_bucket = min(self._ke_bucket, self._ke_rate)
+            self._ke_blocked_until = max(self._ke_blocked_until, time.time() + delay)
+        log.warning(f"KE API rate limited (429). Pausing {delay:.1f}s; KE rate now {self._ke_rate:.1f} req/s.")
+    # --- END KE throttling ---
 
     # --- MODIFIED _make_ke_request ---
     def _make_ke_request(self, endpoint_url: str, payload: dict) -> Optional[dict]: # Return full dict
@@ -115,60 +341,177 @@ class ContentWorkflowService:
             log.error(f"Cannot call KE endpoint {endpoint_url}, API key missing.")
             return None
 
+        _ident = payload.get('keyword') or payload.get('url') or '<?>' # Used by every log line below
         log.info(f"Calling KE API: {endpoint_url} with payload keys: {list(payload.keys())}") # Log keys only
         log.debug(f"Full KE Payload: {payload}") # Debug full payload
-        headers = {
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.ke_api_key}'
-            # KE uses form data, requests handles Content-Type
-        }
-        time.sleep(0.7) # Slightly increased delay for KE politeness
+        wait_time = self._ke_reserve() # Only waits when the bucket is empty or KE asked us to back off
+        if wait_time > 0: time.sleep(wait_time)
 
         try:
-            response = requests.post(endpoint_url, data=payload, headers=headers, timeout=45) # Increased timeout
+            response = self._ke_session.post(endpoint_url, data=payload, timeout=45) # Session carries auth headers
 
             if response.status_code == 200:
-                response_data = response.json()
+                response_data = _json_loads(response.content)
                 credits = response_data.get('credits_consumed', 0)
-                log.info(f"KE API success for {payload.get('keyword') or payload.get('url')}. Credits used: {credits}")
+                log.info(f"KE API success for {_ident}. Credits used: {credits}")
                 return response_data # Return the full parsed JSON response
             elif response.status_code == 402:
-                 error_data = response.json()
-                 log.error(f"KE API Error (402) for {payload.get('keyword') or payload.get('url')}: {error_data.get('message')} - {error_data.get('description')}")
+                 error_data = _json_loads(response.content)
+                 log.error(f"KE API Error (402) for {_ident}: {error_data.get('message')} - {error_data.get('description')}")
+                 return None
+            elif response.status_code == 429:
+                 self._ke_rate_limited(response.headers.get('Retry-After'))
                  return None
             else:
-                log.error(f"KE API Error for {payload.get('keyword') or payload.get('url')}: Status {response.status_code} - Response: {response.text[:300]}")
+                log.error(f"KE API Error for {_ident}: Status {response.status_code} - Response: {response.content[:300].decode('utf-8', errors='replace')}") # Decode only the logged slice
                 return None
 
         except requests.exceptions.Timeout:
-             log.error(f"KE API request timed out for {payload.get('keyword') or payload.get('url')}")
+             log.error(f"KE API request timed out for {_ident}")
              return None
         except requests.exceptions.RequestException as e:
-            log.error(f"KE API request failed for {payload.get('keyword') or payload.get('url')}: {e}")
+            log.error(f"KE API request failed for {_ident}: {e}")
             return None
         except Exception as e:
-            log.error(f"Unexpected error during KE API call for {payload.get('keyword') or payload.get('url')}: {e}", exc_info=True)
+            log.error(f"Unexpected error during KE API call for {_ident}: {e}", exc_info=True)
             return None
     # --- END MODIFIED _make_ke_request ---
 
+    # --- NEW: async KE requests (concurrent competitor URL fetches) ---
+    KE_ASYNC_CONCURRENCY = 5 # Max in-flight KE requests (politeness)
+
+    async def _make_ke_request_async(self, session: aiohttp.ClientSession, endpoint_url: str, payload: dict) -> Optional[dict]:
+        """Async sibling of _make_ke_request; same logging and error handling, shared aiohttp session."""
+        if not self.ke_api_key:
+            log.error(f"Cannot call KE endpoint {endpoint_url}, API key missing.")
+            return None
+
+        _ident = payload.get('keyword') or payload.get('url') or '<?>'
+        log.info(f"Calling KE API (async): {endpoint_url} with payload keys: {list(payload.keys())}")
+        headers = {
+            'Accept': 'application/json',
+            'Authorization': f'Bearer {self.ke_api_key}'
+        }
+        wait_time = self._ke_reserve()
+        if wait_time > 0: await asyncio.sleep(wait_time)
+        try:
+            async with session.post(endpoint_url, data=payload, headers=headers) as response:
+                if response.status == 200:
+                    response_data = _json_loads(await response.read())
+                    credits = response_data.get('credits_consumed', 0)
+                    log.info(f"KE API success for {_ident}. Credits used: {credits}")
+                    return response_data
+                elif response.status == 402:
+                    error_data = _json_loads(await response.read())
+                    log.error(f"KE API Error (402) for {_ident}: {error_data.get('message')} - {error_data.get('description')}")
+                    return None
+                elif response.status == 429:
+                    self._ke_rate_limited(response.headers.get('Retry-After'))
+                    return None
+                else:
+                    snippet = (await response.content.read(300)).decode('utf-8', errors='replace') # Read/decode only what's logged
+                    log.error(f"KE API Error for {_ident}: Status {response.status} - Response: {snippet}")
+                    return None
+        except asyncio.TimeoutError:
+            log.error(f"KE API request timed out for {_ident}")
+            return None
+        except aiohttp.ClientError as e:
+            log.error(f"KE API request failed for {_ident}: {e}")
+            return None
+        except Exception as e:
+            log.error(f"Unexpected error during KE API call for {_ident}: {e}", exc_info=True)
+            return None
+
+    async def _fetch_ke_keywords(self, keyword: str, urls: List[str], country: str = "us",
+                                 pasf_num: int = 10, related_num: int = 15, url_num: int = 50):
+        """
+        Fetches PASF, Related and per-URL keywords from KE in one concurrent wave.
+
+        Returns:
+            tuple: (pasf_keywords, related_keywords, url_keyword_lists) -- one list per URL, in order.
+        """
+        semaphore = asyncio.Semaphore(self.KE_ASYNC_CONCURRENCY)
+
+        async def post(session, endpoint, payload):
+            async with semaphore:
+                return await self._make_ke_request_async(session, endpoint, payload)
+
+        async def skip():
+            return None
+
+        # PASF / Related come from the disk cache when possible (no credits spent)
+        pasf_cached = self._ke_cache_get('pasf', keyword, pasf_num)
+        related_cached = self._ke_cache_get('related', keyword, related_num)
+
+        connector = aiohttp.TCPConnector(limit=8)
+        timeout = aiohttp.ClientTimeout(total=45)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            pasf_task = (post(session, "https://api.keywordseverywhere.com/v1/get_pasf_keywords", {"keyword": keyword, "num": pasf_num})
+                         if pasf_cached is None else skip())
+            related_task = (post(session, "https://api.keywordseverywhere.com/v1/get_related_keywords", {"keyword": keyword, "num": related_num})
+                            if related_cached is None else skip())
+            url_tasks = [post(session, "https://api.keywordseverywhere.com/v1/get_url_keywords", {"url": url, "country": country, "num": url_num})
+                         for url in urls]
+            results = await asyncio.gather(pasf_task, related_task, *url_tasks, return_exceptions=True)
+
+        def ok(result, label):
+            if isinstance(result, Exception):
+                log.error(f"KE fetch failed for {label}: {result}")
+                return None
+            return result
+
+        pasf_keywords = pasf_cached if pasf_cached is not None else \
+            self._ke_keyword_list_result('pasf', keyword, pasf_num, ok(results[0], f"PASF '{keyword}'"))
+        related_keywords = related_cached if related_cached is not None else \
+            self._ke_keyword_list_result('related', keyword, related_num, ok(results[1], f"Related '{keyword}'"))
+        url_keyword_lists = [self._extract_url_keywords(url, ok(result, url)) for url, result in zip(urls, results[2:])]
+        return pasf_keywords, related_keywords, url_keyword_lists
+    # --- END NEW async KE requests ---
+
     # --- MODIFIED _get_ke_pasf ---
     def _get_ke_pasf(self, keyword: str, num: int = 10) -> List[str]:
         """Gets 'People Also Search For' keywords from KE API."""
+        cached = self._ke_cache_get('pasf', keyword, num)
+        if cached is not None: return cached
         endpoint = "https://api.keywordseverywhere.com/v1/get_pasf_keywords"
         payload = {"keyword": keyword, "num": num}
         response_data = self._make_ke_request(endpoint, payload)
-        # Data format is array of strings
-        return response_data.get('data', []) if response_data and isinstance(response_data.get('data'), list) else []
+        return self._ke_keyword_list_result('pasf', keyword, num, response_data)
     # --- END MODIFIED _get_ke_pasf ---
 
+    def _ke_cache_get(self, kind: str, keyword: str, num: int) -> Optional[List[str]]:
+        """Returns cached PASF / Related keywords, or None on miss / no cache."""
+        if self._ke_cache is None: return None
+        try:
+            return self._ke_cache.get(f"{kind}:{keyword.lower().strip()}:{num}")
+        except Exception as e:
+            log.warning(f"KE cache read failed: {e}")
+            return None
+
+    def _ke_keyword_list_result(self, kind: str, keyword: str, num: int, response_data: Optional[dict]) -> List[str]:
+        """Extracts a PASF / Related keyword list; caches it when KE actually answered."""
+        keywords = self._extract_keyword_list(response_data)
+        if response_data is not None and self._ke_cache is not None:
+            try:
+                self._ke_cache.set(f"{kind}:{keyword.lower().strip()}:{num}", keywords, expire=KE_CACHE_TTL)
+            except Exception as e:
+                log.warning(f"KE cache write failed: {e}")
+        return keywords
+
+    @staticmethod
+    def _extract_keyword_list(response_data: Optional[dict]) -> List[str]:
+        """PASF / Related responses: data format is array of strings."""
+        return response_data.get('data', []) if response_data and isinstance(response_data.get('data'), list) else []
+
     # --- MODIFIED _get_ke_related ---
     def _get_ke_related(self, keyword: str, num: int = 15) -> List[str]:
         """Gets 'Related Keywords' from KE API."""
+        cached = self._ke_cache_get('related', keyword, num)
+        if cached is not None: return cached
         endpoint = "https://api.keywordseverywhere.com/v1/get_related_keywords"
         payload = {"keyword": keyword, "num": num}
         response_data = self._make_ke_request(endpoint, payload)
-        # Data format is array of strings
-        return response_data.get('data', []) if response_data and isinstance(response_data.get('data'), list) else []
+        return self._ke_keyword_list_result('related', keyword, num, response_data)
     # --- END MODIFIED _get_ke_related ---
 
     # --- NEW: KE URL Keywords Helper ---
@@ -177,9 +520,13 @@ class ContentWorkflowService:
         endpoint = "https://api.keywordseverywhere.com/v1/get_url_keywords"
         payload = {"url": url, "country": country, "num": num}
         response_data = self._make_ke_request(endpoint, payload)
+        return self._extract_url_keywords(url, response_data)
+
+    def _extract_url_keywords(self, url: str, response_data: Optional[dict]) -> List[str]:
+        """Pulls the keyword strings out of a KE get_url_keywords response."""
         if response_data and isinstance(response_data.get('data'), list):
-             # Extract just the keyword strings from the list of objects
-             keywords = [item.get('keyword') for item in response_data['data'] if isinstance(item, dict) and item.get('keyword')]
+             # Extract just the keyword strings (KE data items are schema-stable dicts); one lookup per item
+             keywords = [kw for item in response_data['data'] if (kw := item.get('keyword'))]
              log.info(f"Extracted {len(keywords)} keywords for URL: {url}")
              return keywords
         log.warning(f"Could not extract keywords for URL {url}. Response data: {response_data}")
@@ -195,7 +542,7 @@ class ContentWorkflowService:
 
         retries = 0
         while retries < self.max_retries:
-            self._apply_rate_limiting()
+            self._apply_rate_limiting(len(prompt) // 4 + max_tokens)
             try:
                 message = self.anthropic_client.messages.create(
                     model=self.claude_model,
@@ -211,7 +558,7 @@ class ContentWorkflowService:
                 log.warning(f"Anthropic connection error (Attempt {retries+1}): {e}")
             except anthropic.RateLimitError as e:
                 log.warning(f"Anthropic rate limit error (Attempt {retries+1}): {e}")
-                time.sleep((2 ** retries) * 5 + random.uniform(0, 3)) # Longer backoff for rate limits
+                time.sleep(self._anthropic_rate_limit_wait(e, retries)) # Honor retry-after for rate limits
             except anthropic.APIStatusError as e:
                 log.error(f"Anthropic API status error ({e.status_code}) (Attempt {retries+1}): {e.response}")
                 if e.status_code < 500: break # Don't retry client errors
@@ -227,6 +574,36 @@ class ContentWorkflowService:
         log.error("Failed to get AI suggestion after multiple retries.")
         return None
 
+    @staticmethod
+    def _open_disk_cache(directory: str):
+        """Opens a diskcache.Cache, or returns None if diskcache is missing or the cache can't be opened."""
+        if diskcache is None: return None
+        try:
+            return diskcache.Cache(directory)
+        except Exception as e:
+            log.warning(f"Could not open disk cache at '{directory}', continuing without it: {e}")
+            return None
+
+    def _ai_cache_key(self, kind: str, keyword: str) -> str:
+        return f"{kind}:{_WS_RE.sub(' ', keyword.lower().strip())}"
+
+    def _ai_cache_get(self, kind: str, keyword: str):
+        """Returns a cached AI fallback result, or None on miss / no cache."""
+        if self._ai_cache is None: return None
+        try:
+            return self._ai_cache.get(self._ai_cache_key(kind, keyword))
+        except Exception as e:
+            log.warning(f"AI fallback cache read failed: {e}")
+            return None
+
+    def _ai_cache_set(self, kind: str, keyword: str, value):
+        """Stores a successfully parsed AI fallback result (defaults are never cached)."""
+        if self._ai_cache is None: return
+        try:
+            self._ai_cache.set(self._ai_cache_key(kind, keyword), value, expire=AI_FALLBACK_CACHE_TTL)
+        except Exception as e:
+            log.warning(f"AI fallback cache write failed: {e}")
+
     def _get_ai_keywords(self, keyword: str) -> dict:
         log.info(f"Using AI fallback to generate keywords for '{keyword}'")
         prompt = f"""Suggest relevant keywords for a blog post about "{keyword}". Provide:
@@ -243,9 +620,9 @@ Format the response ONLY as a JSON object like this:
         if response:
             try:
                 # Try to find JSON within potentially messy response
-                json_match = re.search(r'\{.*\}', response, re.DOTALL)
+                json_match = _JSON_OBJ_RE.search(response)
                 if json_match:
-                    data = json.loads(json_match.group(0))
+                    data = _json_loads(response[json_match.start():json_match.end()])
                     return {
                         'must_have': data.get('primary', []),
                         'recommended': data.get('secondary', [])
@@ -257,6 +634,10 @@ Format the response ONLY as a JSON object like this:
         return {'must_have': [keyword], 'recommended': []} # Fallback includes main keyword
 
     def _get_ai_structure(self, keyword: str) -> list:
+        cached = self._ai_cache_get('struct', keyword)
+        if cached is not None:
+            log.info(f"Using cached AI structure for '{keyword}'")
+            return cached
         log.info(f"Using AI fallback to generate structure for '{keyword}'")
         prompt = f"""Suggest a logical article structure (section headings) for a comprehensive blog post about "{keyword}". Provide 7-9 headings excluding introduction and conclusion.
 
@@ -267,11 +648,12 @@ Format the response ONLY as a simple JSON list of strings:
         structure = ["Introduction", f"Understanding {keyword.title()}", "Key Features", "Benefits", "Conclusion"] # Basic default
         if response:
             try:
-                json_match = re.search(r'\[.*\]', response, re.DOTALL)
+                json_match = _JSON_ARR_RE.search(response)
                 if json_match:
-                    headings = json.loads(json_match.group(0))
+                    headings = _json_loads(response[json_match.start():json_match.end()])
                     if isinstance(headings, list) and len(headings) > 2:
                         structure = ["Introduction"] + headings + ["Conclusion"]
+                        self._ai_cache_set('struct', keyword, structure)
                 else:
                     log.warning("Could not extract JSON list from AI structure response.")
             except json.JSONDecodeError:
@@ -279,6 +661,10 @@ Format the response ONLY as a simple JSON list of strings:
         return structure
 
     def _get_ai_faqs(self, keyword: str) -> list:
+        cached = self._ai_cache_get('faq', keyword)
+        if cached is not None:
+            log.info(f"Using cached AI FAQs for '{keyword}'")
+            return cached
         log.info(f"Using AI fallback to generate FAQs for '{keyword}'")
         prompt = f"""Suggest 3-5 frequently asked questions (FAQs) a user searching for "{keyword}" might have.
 
@@ -289,10 +675,11 @@ Format the response ONLY as a simple JSON list of strings:
         faqs = []
         if response:
             try:
-                json_match = re.search(r'\[.*\]', response, re.DOTALL)
+                json_match = _JSON_ARR_RE.search(response)
                 if json_match:
-                    faqs = json.loads(json_match.group(0))
+                    faqs = _json_loads(response[json_match.start():json_match.end()])
                     if not isinstance(faqs, list): faqs = [] # Ensure it's a list
+                    if faqs: self._ai_cache_set('faq', keyword, faqs[:5])
                 else:
                     log.warning("Could not extract JSON list from AI FAQ response.")
             except json.JSONDecodeError:
@@ -300,6 +687,10 @@ Format the response ONLY as a simple JSON list of strings:
         return faqs[:5] # Return up to 5
 
     def _get_ai_word_count(self, keyword: str) -> int:
+        cached = self._ai_cache_get('wc', keyword)
+        if cached is not None:
+            log.info(f"Using cached AI word count for '{keyword}': {cached}")
+            return cached
         log.info(f"Using AI fallback to estimate word count for '{keyword}'")
         prompt = f"""Based on the keyword "{keyword}", estimate an appropriate target word count for a comprehensive, high-quality blog post. Consider typical user intent and topic depth.
 
@@ -308,12 +699,13 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
         response = self._get_ai_suggestion(prompt, system_prompt, max_tokens=50)
         word_count = 1500 # Default fallback
         if response:
-            match = re.search(r'\b(\d{3,4})\b', response) # Look for 3 or 4 digit number
+            match = _WC_RE.search(response) # Look for 3 or 4 digit number
             if match:
                 try:
                     word_count = int(match.group(1))
                     # Basic sanity check
                     word_count = min(max(1000, word_count), 5000)
+                    self._ai_cache_set('wc', keyword, word_count)
                 except ValueError:
                      log.warning(f"Could not parse word count number from AI response: {response}")
             else:
@@ -322,13 +714,40 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
         log.info(f"AI estimated word count: {word_count}")
         return word_count
 
+    def _category_lookup(self, product_categories: list) -> dict:
+        """
+        Returns {normalized name: category} for a categories list, memoized per list object so
+        repeated briefs against the same cached list skip the rebuild.
+        """
+        cached = self._cat_lookup_cache.get(id(product_categories))
+        if cached is not None and cached[0] is product_categories: # Guard against id() reuse
+            return cached[1]
+
+        named = [cat for cat in product_categories if cat.get('name')]
+        names = pd.Series([cat['name'] for cat in named], dtype=object).str.lower().str.strip()
+        lookup = dict(zip(names, named))
+
+        if len(self._cat_lookup_cache) >= 8: self._cat_lookup_cache.clear()
+        self._cat_lookup_cache[id(product_categories)] = (product_categories, lookup)
+        return lookup
+
+    @staticmethod
+    def _fuzzy_category_key(query_lower: str, category_names_lower: dict, cutoff: float = 90) -> Optional[str]:
+        """Near-exact category name for a query (plural/typo variants); only called after an exact-match miss."""
+        if rf_process is not None:
+            result = rf_process.extractOne(query_lower, list(category_names_lower), scorer=rf_fuzz.ratio, score_cutoff=cutoff)
+            return result[0] if result else None
+        matches = difflib.get_close_matches(query_lower, list(category_names_lower), n=1, cutoff=cutoff / 100)
+        return matches[0] if matches else None
+
     # --- MODIFIED generate_content_brief ---
     # Fix for ContentWorkflowService class - use the exact method name expected
 
     def generate_content_brief(self, query_data):
         """
-        Generates a content brief using KE APIs, Google Search for URLs (no scraping),
-        AI fallbacks for structure/FAQs/WC, and checks for existing categories.
+        Generates a content brief using KE APIs, Google Search plus the top competitor pages
+        (word count / structure / FAQs, with AI fallbacks where those are thin), and checks
+        for existing categories.
 
         The method now accepts cached category data via query_data to avoid repeatedly
         fetching the same categories from WordPress.
@@ -351,6 +770,7 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
         analysis_error_msg = None
         notes_addition = ""
         has_product_category = False # Initialize category flag
+        f_struct = f_faq = f_wc = None # AI fallback futures (cancelled if the brief fails)
 
         try:
             # --- **** START STEP 0: Use cached categories if available **** ---
@@ -361,13 +781,13 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
                 # Fall back to fetching categories if not provided in query_data
                 log.info(f"No cached categories found. Fetching product categories for '{query}' gap analysis...")
                 product_categories = self._fetch_site_categories(taxonomy='product_cat')
-                category_names_lower = {cat.get('name','').lower().strip(): cat for cat in product_categories if cat.get('name')}
+                category_names_lower = self._category_lookup(product_categories)
                 log.debug(f"Fetched {len(product_categories)} product categories.")
             else:
                 log.info(f"Using cached categories ({len(product_categories)}) for '{query}' gap analysis.")
                 if category_mapping is None:
-                    # Create mapping only if not provided
-                    category_names_lower = {cat.get('name','').lower().strip(): cat for cat in product_categories if cat.get('name')}
+                    # Create mapping only if not provided (memoized per categories list)
+                    category_names_lower = self._category_lookup(product_categories)
                 else:
                     # Use provided mapping directly
                     category_names_lower = category_mapping
@@ -381,12 +801,20 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             category_word_limit = 500
 
             query_lower = query.lower()
-            if query_lower in category_names_lower:
+            matched_cat = None
+            if query_lower in category_names_lower: # Exact (d=0) fast path: dict hit, no fuzzy scoring
                 log.info(f"Found EXACT matching product category for '{query}'. Setting recommendation to 'dual_content'.")
+                matched_cat = category_names_lower[query_lower]
+            elif category_names_lower:
+                fuzzy_key = self._fuzzy_category_key(query_lower, category_names_lower)
+                if fuzzy_key:
+                    log.info(f"Found near-exact product category '{fuzzy_key}' for '{query}'. Setting recommendation to 'dual_content'.")
+                    matched_cat = category_names_lower[fuzzy_key]
+
+            if matched_cat:
                 has_product_category = True
                 recommendation = 'dual_content'
                 reason = 'Matching product category exists. Recommend updating description and creating blog post.'
-                matched_cat = category_names_lower[query_lower]
                 # Get existing description length (requires enhancement in _fetch_site_categories or separate call)
                 # For now, assume length is 0 or fetch separately if needed
                 existing_desc_len = 0 # Placeholder
@@ -398,8 +826,10 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
                 })
             # --- **** END STEP 1 **** ---
 
-            # 2. Get competitor URLs from Google Search API (no scraping)
-            competitor_analysis = self.analyzer.analyze_competitor_content(query, num_results=15)
+            # 2. Get competitor URLs from Google Search API, with signals read from the top pages
+            competitor_analysis = self.analyzer.analyze_competitor_content(query, num_results=15) or {}
+            competitor_structure = []
+            competitor_faqs = []
 
             if not competitor_analysis or competitor_analysis.get('error'):
                 log.warning(f"Google search API failed for '{query}': {competitor_analysis.get('error', 'Unknown')}. Using AI fallbacks.")
@@ -411,29 +841,40 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
                 # Extract URLs from successful API search
                 example_urls = competitor_analysis.get('example_urls', [])
                 log.info(f"Received {len(example_urls)} top URLs for '{query}' from Google Search API.")
-
-            # 3. Use AI fallbacks for structure, FAQs, and word count
-            log.info(f"Using AI fallbacks for content structure, FAQs, and word count for '{query}'")
-            content_structure = self._get_ai_structure(query)
-            faq_questions = self._get_ai_faqs(query)
-            recommended_length = self._get_ai_word_count(query)
+                # Signals the analyzer can supply directly; when present, the matching AI fallback is skipped
+                competitor_structure = competitor_analysis.get('content_structure') or []
+                competitor_faqs = competitor_analysis.get('faq_questions') or []
+                avg_word_count = int(competitor_analysis.get('avg_word_count') or 0)
+
+            # 3. Use AI fallbacks for structure, FAQs, and word count -- only where competitor data is thin
+            # Independent Claude calls: run them in threads (overlapping the KE fetches below too)
+            f_struct = _ai_fallback_executor.submit(self._get_ai_structure, query) if len(competitor_structure) < 2 else None
+            f_faq = _ai_fallback_executor.submit(self._get_ai_faqs, query) if len(competitor_faqs) < 2 else None
+            f_wc = _ai_fallback_executor.submit(self._get_ai_word_count, query) if avg_word_count <= 0 else None
+            skipped = [name for name, f in (('structure', f_struct), ('FAQs', f_faq), ('word count', f_wc)) if f is None]
+            log.info(f"Using AI fallbacks for content structure, FAQs, and word count for '{query}'"
+                     + (f" (skipped, competitor data used: {', '.join(skipped)})" if skipped else ""))
 
             # 4. Get Keywords using KE APIs (URL Keywords, PASF, Related)
+            # PASF, Related and every competitor URL go out in one concurrent wave (bounded by a semaphore)
+            log.info(f"Fetching KE PASF/Related keywords and URL Keywords for {len(example_urls)} competitor URLs...")
+            pasf_keywords, related_keywords, url_keyword_lists = asyncio.run(
+                self._fetch_ke_keywords(query, example_urls, pasf_num=10, related_num=15, url_num=50)
+            )
+
             all_competitor_keywords = []
             if example_urls:
-                log.info(f"Fetching KE URL Keywords for {len(example_urls)} competitor URLs...")
-                for url in example_urls:
-                    keywords_for_url = self._get_ke_url_keywords(url, num=50)
+                for keywords_for_url in url_keyword_lists:
                     if keywords_for_url: # Check if list is not empty
                         all_competitor_keywords.extend(keywords_for_url)
-                    time.sleep(0.2)
 
                 if all_competitor_keywords:
-                    keyword_counts = Counter(all_competitor_keywords)
-                    must_include_phrases = [kw for kw, count in keyword_counts.most_common(100) if count >= 2][:15]
+                    # One value_counts pass; Index set ops instead of repeated most_common() + list `in` scans
+                    keyword_counts = pd.Series(all_competitor_keywords).value_counts().head(100)
+                    must_include_phrases = keyword_counts[keyword_counts >= 2].head(15).index.tolist()
                     needed = 15 - len(must_include_phrases)
-                    if needed > 0: must_include_phrases.extend([kw for kw, count in keyword_counts.most_common(15) if kw not in must_include_phrases][:needed])
-                    recommended_phrases = [kw for kw, count in keyword_counts.most_common(100) if kw not in must_include_phrases][:30]
+                    if needed > 0: must_include_phrases.extend(keyword_counts.head(15).index.difference(must_include_phrases, sort=False)[:needed].tolist())
+                    recommended_phrases = keyword_counts.drop(must_include_phrases).head(30).index.tolist()
                     log.info(f"Generated {len(must_include_phrases)} must-include and {len(recommended_phrases)} recommended keywords from KE URL data.")
                 else: log.warning(f"KE URL Keywords API returned no keywords for competitors of '{query}'.")
             else: log.warning(f"No competitor URLs available to fetch KE keywords for '{query}'.")
@@ -445,8 +886,9 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
                 must_include_phrases = ai_keywords.get('must_have', [query])
                 recommended_phrases = ai_keywords.get('recommended', [])
 
-            pasf_keywords = self._get_ke_pasf(query, num=10)
-            related_keywords = self._get_ke_related(query, num=15)
+            content_structure = f_struct.result() if f_struct else competitor_structure
+            faq_questions = f_faq.result() if f_faq else competitor_faqs[:5]
+            recommended_length = f_wc.result() if f_wc else min(max(1000, int(round(avg_word_count, -2))), 5000)
             # ---
 
             # 5. Assemble the Brief Dictionary
@@ -509,6 +951,10 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             return brief
 
         except Exception as e:
+            # Don't start (and bill) fallback calls for a brief that won't be returned;
+            # ones already running finish and land in the disk cache for the next attempt
+            for future in (f_struct, f_faq, f_wc):
+                if future: future.cancel()
             query_label = safe_get(query_data, 'query', 'unknown query')
             log.error(f"Error generating brief for '{query_label}': {str(e)}", exc_info=True)
             return None
@@ -559,136 +1005,67 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             # ---
 
             # --- Content Specs ---
-            content_specs_list = [
+            base_specs = (
                 f"- Primary Keyword Focus: **{keyword}**",
                 f"- Search Intent: {search_intent}",
-                f"- Target Word Count: **EXACTLY {target_word_count} words** (Strict Requirement)"
-            ]
+                f"- Target Word Count: **EXACTLY {target_word_count} words** (Strict Requirement)",
+            )
+            extra_specs = ()
+            is_dual_content = recommendation_type == 'dual_content'
+            guidelines_tmpl, dual_instr_tmpl = _prompt_skeleton(target_word_count, category_word_limit if is_dual_content else None, is_dual_content)
             dual_content_instructions = ""
-            if recommendation_type == 'dual_content':
-                content_specs_list.append(f"- Target word count for category description: 350-{category_word_limit} words")
-                content_specs_list.append(f"- Target word count for blog post: {target_word_count} words")
+            if is_dual_content:
+                extra_specs = (
+                    f"- Target word count for category description: 350-{category_word_limit} words",
+                    f"- Target word count for blog post: {target_word_count} words",
+                )
                 if update_targets:
-                    content_specs_list.append(f"- Update the following category description and create a related blog post:")
-                    for target in update_targets:
-                        title = safe_get(target, 'title', 'Untitled')
-                        length = safe_get(target, 'content_length', 0)
-                        content_specs_list.append(f"  * {title} (Current length: {length} words)")
-                    content_specs_list.append(f"- The category description should be concise (350-{category_word_limit} words) and focused on helping shoppers")
-                    content_specs_list.append(f"- The blog post should be comprehensive ({target_word_count} words) and educational")
-                    content_specs_list.append(f"- Include cross-linking between the category and blog post")
-
-                # Make sure .format() has all needed variables
-                dual_content_instructions = """
-    Special Formatting Instructions for Dual Content:
-    Please format your response with clear separation between the two content pieces:
-
-    === CATEGORY DESCRIPTION ===
-    [Category description content here - 350-{category_word_limit} words]
-
-    === BLOG POST ===
-    [Full blog post content here - target word count as specified ({target_word_count} words)]
-
-    For the category description:
-    - Focus on helping shoppers make purchase decisions
-    - Mention key benefits and features of our products
-    - Include a brief "Learn more about [{keyword}] in our detailed guide: [BLOG TITLE]" at the end (replace bracketed terms)
-
-    For the blog post:
-    - Create comprehensive, educational content
-    - Include a "Shop our collection of [{keyword}] at Cave Supplies" with a reference to the category (replace bracketed term)
-    - Focus on answering common questions and providing value
-    """.format(keyword=keyword, category_word_limit=category_word_limit, target_word_count=target_word_count)
-
-            content_specs = "\n".join(content_specs_list)
+                    extra_specs += (
+                        f"- Update the following category description and create a related blog post:",
+                        *(f"  * {safe_get(target, 'title', 'Untitled')} (Current length: {safe_get(target, 'content_length', 0)} words)"
+                          for target in update_targets),
+                        f"- The category description should be concise (350-{category_word_limit} words) and focused on helping shoppers",
+                        f"- The blog post should be comprehensive ({target_word_count} words) and educational",
+                        f"- Include cross-linking between the category and blog post",
+                    )
+
+                dual_content_instructions = dual_instr_tmpl.substitute(keyword=keyword)
+
+            content_specs = "\n".join((*base_specs, *extra_specs))
             # ---
 
             # --- Brand Context ---
-            # Fill in the full text here
-            brand_context = """
-    Brand Voice and Context:
-    - Website: Cave Supplies - online retailer of man cave furniture and home decor (bars, game rooms, home theaters, offices).
-    - Target Audience: Men personalizing smaller spaces, or those whose partners manage main home decor. Focus on versatility and space-efficiency.
-    - Mascot (Optional): Thorak, a prehistoric caveman amazed by modern comforts (use sparingly for humor, simple broken sentences: "Thorak like sturdy stool.").
-    - Tone: Authoritative but approachable and relatable for the target audience. We sell premium products, so avoid overly casual or slang language. Focus on quality, features, benefits, and helping the user create their ideal space.
-    """
+            brand_context = _BRAND_CONTEXT
             # ---
 
             # --- Keyword Usage Instructions ---
-            keyword_usage_instructions = f"""
-    Keyword Usage Instructions & Internal Linking:
-    - **Strict Relevance Required:** Your primary goal is to create the best possible article about **"{keyword}"**.
-    - **Evaluate Provided Keywords:** Below are keyword lists derived from competitor analysis (what they rank for), user searches (PASF), and related topics. YOU MUST EVALUATE these lists critically.
-    - **INCLUDE ONLY TOPICALLY RELEVANT KEYWORDS** that directly relate to **"{keyword}"** and fit naturally within the article's context.
-    - **EXCLUDE / IGNORE:**
-        - **Competitor Brand Names:** Absolutely do not mention competitor brands like Wayfair, Amazon, Etsy, Overstock, IKEA, Target, Walmart, Home Depot, Lowes, etc..
-        - **Generic/Navigational Terms:** Ignore terms like 'login', 'near me', 'store', 'customer service', 'free shipping', 'sale', 'discount', 'clearance', 'coupon', 'location', 'reviews' .
-        - **Clearly Unrelated Topics:** Disregard keywords about unrelated product categories (e.g., if the topic is 'bar stools', ignore 'dog ramps', 'rugs', 'carpets', 'outdoor pools', 'kitchen appliances', 'sweater dressers', 'bedding', 'sofas' unless it's a 'sofa bed'). Use common sense to determine relevance to the main topic: **"{keyword}"**. If a term seems borderline, err on the side of *not* including it if it distracts from the main topic.
-        - **Poor Quality/Gibberish:** Ignore any keywords that look like errors, code snippets, or are nonsensical.
-    - **Natural Integration:** Weave the *relevant* selected keywords naturally into the text. Avoid forcing keywords or creating unnatural sentences (keyword stuffing). Prioritize using the Primary list keywords most often.
-        - **Internal Link Suggestions:** As you write, identify 8-12 opportunities for internal links (product categories, related products, specific features). Format these suggestions EXACTLY as follows, replacing the placeholder text:
-        `<span class="link-opportunity" data-link-suggestion="Describe the ideal target page here">exact phrase to link</span>`
-    - **Example Link Suggestions:**
-        - `...check out our collection of <span class="link-opportunity" data-link-suggestion="Product category page for wooden bar stools">wooden bar stools</span> for a classic look.`
-        - `...consider <span class="link-opportunity" data-link-suggestion="Product category page for swivel bar stools">swivel functionality</span> if you need flexibility.`
-    """
+            keyword_usage_instructions = _KEYWORD_USAGE_TMPL.substitute(keyword=keyword)
             # ---
 
             # --- Content & Formatting Guidelines ---
-            content_guidelines = f"""
-    Content & Formatting Guidelines:
-    - Write comprehensive, valuable, and engaging content focused on **"{keyword}"**. Ensure factual accuracy.
-    - Use proper HTML: <h2> for main sections (aim for 8-10+ sections to achieve the target word count), <h3> for subsections, <p> for paragraphs, <ul>/<li> for lists, <strong>/<em> for emphasis where appropriate.
-    - DO NOT include an H1 title tag. Start content directly with the first `<h2>` tag.
-    - Structure content logically using the suggested outline below as a guide, but feel free to adapt it if necessary for quality and flow.
-    - Use short paragraphs (generally 2-4 sentences) and bullet points for better readability.
-    - Include a compelling Introduction that hooks the reader and a strong Conclusion that summarizes key takeaways.
-    - Address relevant FAQs from the list below, ideally in a dedicated FAQ section near the end using H3 for each question.
-    - Maintain the Cave Supplies brand voice (authoritative, knowledgeable, helpful, slightly informal but professional, aimed at men building their personal space).
-    - Mention "Cave Supplies" only minimally (1-2 times max), perhaps in the conclusion as a call to action (e.g., "Explore the collection at Cave Supplies").
-    - **Word Count:** The final output MUST be **EXACTLY {target_word_count} words**. Count your words carefully before finishing. If you are under the word count, expand on existing points with more detail, examples, or explanations rather than adding filler.
-    """
+            content_guidelines = guidelines_tmpl.substitute(keyword=keyword)
             # ---
 
             # --- Final Prompt Assembly ---
-            prompt = f"""Please write a comprehensive, SEO-optimized blog article about **"{keyword}"**.
-
-    --- Core Article Requirements ---
-    {content_specs}
-
-    {brand_context}
-
-    {keyword_usage_instructions}
-
-    --- Provided Keyword Data (Evaluate for Relevance) ---
-    Keywords Competitors Rank For (Primary - Use RELEVANT ones most):
-    {primary_kw_str}
-
-    Keywords Competitors Rank For (Secondary - Use RELEVANT ones):
-    {secondary_kw_str}
-
-    People Also Search For (Address RELEVANT user interests):
-    {pasf_str}
-
-    Related Keywords (Incorporate RELEVANT ones):
-    {related_str}
-
-    --- Content Structure & Questions ---
-    Suggested Article Structure:
-    {structure_str}
-
-    Frequently Asked Questions to Address (if relevant):
-    {faq_str}
-
-    {dual_content_instructions}
-
-    {content_guidelines}
-
-    Begin the article directly with the first `<h2>` tag.
-    """
+            prompt = "\n\n".join([
+                f'Please write a comprehensive, SEO-optimized blog article about **"{keyword}"**.',
+                "--- Core Article Requirements ---\n" + content_specs,
+                brand_context,
+                keyword_usage_instructions,
+                "--- Provided Keyword Data (Evaluate for Relevance) ---\n"
+                "Keywords Competitors Rank For (Primary - Use RELEVANT ones most):\n" + primary_kw_str,
+                "Keywords Competitors Rank For (Secondary - Use RELEVANT ones):\n" + secondary_kw_str,
+                "People Also Search For (Address RELEVANT user interests):\n" + pasf_str,
+                "Related Keywords (Incorporate RELEVANT ones):\n" + related_str,
+                "--- Content Structure & Questions ---\n"
+                "Suggested Article Structure:\n" + structure_str,
+                "Frequently Asked Questions to Address (if relevant):\n" + faq_str,
+                dual_content_instructions,
+                content_guidelines,
+                "Begin the article directly with the first `<h2>` tag.",
+            ])
             # Clean up potential leading/trailing whitespace from multiline strings and extra newlines
-            prompt_lines = [line.strip() for line in prompt.splitlines() if line.strip()]
-            final_prompt = "\n".join(prompt_lines)
+            final_prompt = _PROMPT_CLEAN_BLANKS.sub('\n', _PROMPT_CLEAN_EDGES.sub('', prompt)).strip()
 
             log.debug(f"Generated Claude prompt length: {len(final_prompt)} for keyword '{keyword}'")
             if len(final_prompt) < 500: log.warning(f"Generated prompt for '{keyword}' seems unusually short.")
@@ -699,13 +1076,29 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             log.error(f"Error generating Claude prompt for brief '{brief.get('keyword', 'N/A')}': {e}", exc_info=True)
             return "" # Return empty string on error
 
+    CATEGORY_CACHE_TTL = 300 # seconds
+
+    def invalidate_category_cache(self, taxonomy: Optional[str] = None):
+        """Drops cached taxonomy terms (all taxonomies if none given), e.g. after creating categories."""
+        if taxonomy is None:
+            self._cat_cache.clear()
+        else:
+            self._cat_cache.pop(taxonomy, None)
+        if taxonomy in (None, 'product_cat'):
+            self._cat_mapping_cache = None
+
     # --- **** REVISED _fetch_site_categories (Correct Namespace) **** ---
     def _fetch_site_categories(self, taxonomy='product_cat') -> List[Dict]:
-        """Fetches all terms for a given taxonomy using WP REST API."""
+        """Fetches all terms for a given taxonomy using WP REST API (cached per taxonomy for CATEGORY_CACHE_TTL)."""
         if not self.wp_service:
             log.error("WordPressService not available to fetch categories.")
             return []
 
+        entry = self._cat_cache.get(taxonomy)
+        if entry and time.time() - entry[0] < self.CATEGORY_CACHE_TTL:
+            log.debug(f"Using cached terms for taxonomy '{taxonomy}' ({len(entry[1])} terms).")
+            return entry[1]
+
         # --- Determine the correct NAMESPACED REST base ---
         namespaced_rest_base = None
         if taxonomy == 'product_cat':
@@ -731,71 +1124,94 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
 
         all_terms = []
         seen_ids = set()
-        page = 1
         per_page = 100
         MAX_PAGES = 10
+        fetch_failed = False
 
-        while True:
-            if page > MAX_PAGES:
-                log.warning(f"Reached maximum page limit ({MAX_PAGES}) fetching taxonomy '{taxonomy}'. Stopping.")
-                break
-
-            # Construct endpoint using the determined NAMESPACED REST base
-            # The query parameters are appended by _make_request
-            endpoint_with_params = f"{namespaced_rest_base}?per_page={per_page}&page={page}&orderby=name&order=asc&_fields=id,name,slug,parent,count"
-            log.info(f"Fetching {taxonomy} page {page} using namespaced endpoint: {namespaced_rest_base}")
-            log.debug(f"Full endpoint with params for _make_request: {endpoint_with_params}")
+        params_for_request = {
+            'per_page': per_page,
+            'orderby': 'name',
+            'order': 'asc',
+            '_fields': 'id,name,slug,parent,count'
+        }
 
+        def add_terms(terms_data, page):
+            """Dedupes one page of terms into all_terms; returns False on a failed/unexpected response."""
+            if terms_data is None or not isinstance(terms_data, list):
+                log.error(f"Failed to fetch or parse data for {taxonomy} page {page}. Response from _make_request: {terms_data}.")
+                return False
+            new_terms_on_page = 0
+            for term in terms_data:
+                term_id = term.get('id')
+                if term_id and term_id not in seen_ids:
+                    seen_ids.add(term_id)
+                    all_terms.append(term)
+                    new_terms_on_page += 1
+            log.info(f"Fetched {len(terms_data)} terms on page {page}, added {new_terms_on_page} new unique terms. Total unique: {len(all_terms)}")
+            return True
+
+        # Page 1 tells us how many pages there are (X-WP-TotalPages); the rest are fetched concurrently
+        log.info(f"Fetching {taxonomy} page 1 using namespaced endpoint: {namespaced_rest_base}")
+        response_headers = requests.structures.CaseInsensitiveDict() # HTTP/2 servers send lowercase names
+        try:
+            terms_data = self.wp_service._make_request('GET', namespaced_rest_base, params={**params_for_request, 'page': 1},
+                                                       response_headers=response_headers)
+        except Exception as e:
+            log.error(f"Exception during _make_request call from _fetch_site_categories: {e}")
+            terms_data = None # Treat exception as failure
 
-            terms_data = None
+        if not add_terms(terms_data, 1):
+            fetch_failed = True
+        elif len(terms_data) >= per_page:
+            try:
+                total_pages = int(response_headers.get('X-WP-TotalPages', MAX_PAGES))
+            except (TypeError, ValueError):
+                total_pages = MAX_PAGES
+            if total_pages > MAX_PAGES:
+                log.warning(f"Taxonomy '{taxonomy}' has {total_pages} pages; fetching only the first {MAX_PAGES}.")
+                total_pages = MAX_PAGES
+
+            pages = list(range(2, total_pages + 1))
+            calls = [('GET', namespaced_rest_base, {'params': {**params_for_request, 'page': p}}) for p in pages]
             try:
-                # Pass the namespaced base and let _make_request handle params
-                # We need to separate the base from the params for _make_request
-                params_for_request = {
-                    'per_page': per_page,
-                    'page': page,
-                    'orderby': 'name',
-                    'order': 'asc',
-                    '_fields': 'id,name,slug,parent,count'
-                }
-                terms_data = self.wp_service._make_request('GET', namespaced_rest_base, params=params_for_request)
+                results = self.wp_service._make_requests_parallel(calls, max_workers=5)
             except Exception as e:
-                log.error(f"Exception during _make_request call from _fetch_site_categories: {e}")
-                terms_data = None # Treat exception as failure
-
-            # Check if the request was successful and returned a list
-            if terms_data is not None and isinstance(terms_data, list):
-                # Process the received terms
-                new_terms_on_page = 0
-                for term in terms_data:
-                    term_id = term.get('id')
-                    if term_id and term_id not in seen_ids:
-                        seen_ids.add(term_id)
-                        all_terms.append(term)
-                        new_terms_on_page += 1
-
-                log.info(f"Fetched {len(terms_data)} terms on page {page}, added {new_terms_on_page} new unique terms. Total unique: {len(all_terms)}")
-
-                # Check if this was the last page
-                if len(terms_data) < per_page:
-                    log.info(f"Last page reached for taxonomy '{taxonomy}'.")
-                    break # Exit loop, no more terms
-
-                page += 1 # Go to the next page
-                time.sleep(0.1) # Small delay between pages
-
-            else:
-                # Handle API error or unexpected response format
-                log.error(f"Failed to fetch or parse data for {taxonomy} page {page}. Response from _make_request: {terms_data}. Stopping fetch.")
-                break # Exit loop on error
+                log.error(f"Exception during parallel page fetch in _fetch_site_categories: {e}")
+                results = [None] * len(pages)
+            for p, page_data in zip(pages, results): # In page order, so all_terms stays sorted by name
+                if not add_terms(page_data, p):
+                    fetch_failed = True
+        else:
+            log.info(f"Last page reached for taxonomy '{taxonomy}'.")
 
         log.info(f"Finished fetching. Total unique terms found: {len(all_terms)} for taxonomy '{taxonomy}'.")
+        if not fetch_failed: # Don't cache a partial list
+            self._cat_cache[taxonomy] = (time.time(), all_terms)
         return all_terms
     # --- END REVISED ---
 
+    def _category_soa(self, category_mapping: Dict[str, Dict]) -> Dict[str, List]:
+        """
+        Struct-of-arrays view of a category mapping, built once per mapping.
+
+        One row per mapping key (lowercase name or slug), so rapidfuzz scores a flat list of
+        strings and the winning index reads the category fields straight from parallel lists.
+        """
+        cached = self._category_soa_cache
+        if cached and cached[0] is category_mapping:
+            return cached[1]
+        soa = {'names_lower': [], 'names': [], 'slugs': [], 'ids': [], 'urls': []}
+        for cat_key, cat_data in category_mapping.items():
+            soa['names_lower'].append(cat_key)
+            soa['names'].append(cat_data['name'])
+            soa['slugs'].append(cat_data['slug'])
+            soa['ids'].append(cat_data['id'])
+            soa['urls'].append(cat_data['url'])
+        self._category_soa_cache = (category_mapping, soa)
+        return soa
+
     # --- NEW: Fuzzy Match Category ---
-    @staticmethod
-    def _fuzzy_match_category(anchor_text: str, category_mapping: Dict, threshold=0.75) -> Optional[Dict]:
+    def _fuzzy_match_category(self, anchor_text: str, category_mapping: Dict, threshold=0.75) -> Optional[Dict]:
         """Finds the best fuzzy match for anchor text in category names/slugs."""
         anchor_text_lower = anchor_text.lower().strip()
         if not anchor_text_lower: return None
@@ -803,37 +1219,54 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
         best_match_cat = None
         best_ratio = threshold
 
-        for cat_key, cat_data in category_mapping.items():
-            # Compare against both name and slug (lowercase)
-            name_ratio = difflib.SequenceMatcher(None, anchor_text_lower, cat_key).ratio()
-            slug_ratio = difflib.SequenceMatcher(None, anchor_text_lower, cat_data['slug']).ratio()
-            current_ratio = max(name_ratio, slug_ratio)
+        # Basic plural/singular variations of the anchor (the mapping only holds canonical names/slugs)
+        if anchor_text_lower.endswith('s'):
+            candidates = (anchor_text_lower, anchor_text_lower[:-1])
+        else:
+            candidates = (anchor_text_lower, anchor_text_lower + 's')
+
+        if rf_process is not None:
+            # Compare against both name and slug (lowercase). rapidfuzz's ratio is an Indel (LCS)
+            # similarity scaled to 0-100, not difflib's Ratcliff/Obershelp matching blocks, so
+            # scores near the threshold can differ from the SequenceMatcher fallback below
+            # (every slug is also a mapping key, so names_lower covers both)
+            soa = self._category_soa(category_mapping)
+            best_idx = None
+            for candidate in candidates:
+                result = rf_process.extractOne(candidate, soa['names_lower'], scorer=rf_fuzz.ratio, score_cutoff=threshold * 100)
+                if result and result[1] / 100 > best_ratio:
+                    best_ratio = result[1] / 100
+                    best_idx = result[2]
+            if best_idx is not None:
+                best_match_cat = {'id': soa['ids'][best_idx], 'name': soa['names'][best_idx],
+                                  'slug': soa['slugs'][best_idx], 'url': soa['urls'][best_idx]}
+        else:
+            for cat_key, cat_data in category_mapping.items():
+                for candidate in candidates:
+                    # Compare against both name and slug (lowercase)
+                    name_ratio = difflib.SequenceMatcher(None, candidate, cat_key).ratio()
+                    slug_ratio = difflib.SequenceMatcher(None, candidate, cat_data['slug']).ratio()
+                    current_ratio = max(name_ratio, slug_ratio)
 
-            if current_ratio > best_ratio:
-                best_ratio = current_ratio
-                best_match_cat = cat_data
+                    if current_ratio > best_ratio:
+                        best_ratio = current_ratio
+                        best_match_cat = cat_data
 
         # Optional: Add check for exact substring match if no good fuzzy match
-        if not best_match_cat:
-             for cat_key, cat_data in category_mapping.items():
-                  # Ensure checks are case-insensitive
-                  if anchor_text_lower in cat_key.lower() or anchor_text_lower in cat_data['slug'].lower():
-                       if len(anchor_text_lower) > 3:
-                            log.debug(f"Found substring match for '{anchor_text}' in '{cat_key}' or '{cat_data['slug']}'")
-                            return cat_data
+        if not best_match_cat and len(anchor_text_lower) > 3:
+             # Keys and slugs are already lowercase in the mapping
+             substring_match = next((cat_data for cat_key, cat_data in category_mapping.items()
+                                     if anchor_text_lower in cat_key or anchor_text_lower in cat_data['slug']), None)
+             if substring_match:
+                  log.debug(f"Found substring match for '{anchor_text}' in category '{substring_match['name']}'")
+                  return substring_match
         if best_match_cat:
              log.debug(f"Fuzzy matched '{anchor_text}' to category '{best_match_cat['name']}' with ratio {best_ratio:.2f}")
         return best_match_cat
     # --- END NEW ---
 
-    # --- NEW: Process Claude Link Suggestions ---
-    def _process_claude_link_suggestions(self, content: str, primary_keyword: str) -> str:
-        """Finds link suggestions, matches to categories, converts to links or keeps as suggestions."""
-        log.info(f"Processing link suggestions for content related to '{primary_keyword}'...")
-        if not content: return ""
-
-        # 1. Fetch Categories and create mapping
-        categories = self._fetch_site_categories(taxonomy='product_cat')
+    def _build_category_mapping(self, categories: List[Dict]) -> Dict[str, Dict]:
+        """Maps lowercase category names and slugs to category link data (plural/singular variants are tried by the matcher)."""
         category_mapping = {}
         # Ensure wp_service and api_url_base exist before splitting
         site_url = ""
@@ -844,34 +1277,49 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
                  log.error("Could not determine site_url from wp_service.api_url_base")
 
         if categories and site_url:
+            url_prefix = f"{site_url}/product-category/"
+            entries = []
             for category in categories:
-                cat_id = category.get('id')
-                name = category.get('name', '').strip() # Keep original case for display
-                name_lower = name.lower()
-                slug = category.get('slug', '').lower().strip()
+                get = category.get
+                cat_id = get('id')
+                name = get('name', '').strip() # Keep original case for display
+                slug = get('slug', '').lower().strip()
                 if cat_id and name and slug:
-                     cat_url = f"{site_url}/product-category/{slug}/" # Use original slug case for URL if needed
-                     cat_data = {'id': cat_id, 'name': name, 'slug': slug, 'url': cat_url}
-                     # Map by lower case name and slug
-                     category_mapping[name_lower] = cat_data
-                     if slug != name_lower: category_mapping[slug] = cat_data
-                     # Basic plural/singular variations
-                     if name_lower.endswith('s'):
-                          singular = name_lower[:-1]
-                          if singular not in category_mapping: category_mapping[singular] = cat_data
-                     else:
-                          plural = name_lower + 's'
-                          if plural not in category_mapping: category_mapping[plural] = cat_data
+                     cat_data = {'id': cat_id, 'name': name, 'slug': slug, 'url': f"{url_prefix}{slug}/"}
+                     # Map by lower case name and slug; a duplicate key keeps the later category, as before
+                     entries.append((name.lower(), cat_data))
+                     entries.append((slug, cat_data))
+            category_mapping = dict(entries)
             log.info(f"Created category mapping with {len(category_mapping)} variations.")
         else:
              log.warning("Could not fetch categories or site URL, cannot auto-link suggestions.")
+        return category_mapping
 
-        # 2. Find and Replace Suggestions
-        # Use the class="link-opportunity" and data-link-suggestion="..." format
-        suggestion_pattern = r'<span class="link-opportunity" data-link-suggestion="([^"]+)">([^<]+)</span>'
-        # Need html module for escaping in replacement
-        import html
+    def _get_category_mapping(self) -> Dict[str, Dict]:
+        """Returns the product_cat link mapping, rebuilt at most once per CATEGORY_CACHE_TTL."""
+        if self._cat_mapping_cache and time.time() - self._cat_mapping_cache[0] < self.CATEGORY_CACHE_TTL:
+            return self._cat_mapping_cache[1]
+        category_mapping = self._build_category_mapping(self._fetch_site_categories(taxonomy='product_cat'))
+        if category_mapping: # Don't pin an empty mapping from a failed fetch for the whole TTL
+            self._cat_mapping_cache = (time.time(), category_mapping)
+        return category_mapping
 
+    # --- NEW: Process Claude Link Suggestions ---
+    def _process_claude_link_suggestions(self, content: str, primary_keyword: str,
+                                         category_mapping: Optional[Dict[str, Dict]] = None) -> str:
+        """Finds link suggestions, matches to categories, converts to links or keeps as suggestions."""
+        log.info(f"Processing link suggestions for content related to '{primary_keyword}'...")
+        if not content: return ""
+        if 'link-opportunity' not in content:
+            log.info("No link suggestions in content; skipping category lookup.")
+            return content
+
+        # 1. Category mapping (callers may pass one built once for the batch)
+        if category_mapping is None:
+            category_mapping = self._get_category_mapping()
+
+        # 2. Find and Replace Suggestions
+        # Use the class="link-opportunity" and data-link-suggestion="..." format (_LINK_SUGGESTION_RE)
         def replace_match(match):
             suggestion_target = match.group(1)
             anchor_text = match.group(2)
@@ -882,26 +1330,30 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             if matched_category:
                 link_url = matched_category['url']
                 log.info(f"Converting suggestion: Found category link for '{anchor_text}' -> {link_url}")
-                # Use html.escape on anchor_text just in case it contains special characters
-                return f'<a href="{html.escape(link_url)}" class="auto-category-link">{html.escape(anchor_text)}</a>'
+                # Escape anchor_text just in case it contains special characters
+                return f'<a href="{link_url.translate(_HTML_ESCAPE_TABLE)}" class="auto-category-link">{anchor_text.translate(_HTML_ESCAPE_TABLE)}</a>'
             else:
                 log.debug(f"Keeping suggestion: No category match for '{anchor_text}' (Suggestion: '{suggestion_target}')")
                 # Return the original span, ensuring anchor_text inside is properly escaped
                 # It's generally safer to reconstruct it to handle potential HTML injection
-                escaped_anchor = html.escape(anchor_text)
-                escaped_suggestion = html.escape(suggestion_target)
+                escaped_anchor = anchor_text.translate(_HTML_ESCAPE_TABLE)
+                escaped_suggestion = suggestion_target.translate(_HTML_ESCAPE_TABLE)
                 return f'<span class="link-opportunity" data-link-suggestion="{escaped_suggestion}">{escaped_anchor}</span>'
 
 
-        modified_content = re.sub(suggestion_pattern, replace_match, content)
+        modified_content = _LINK_SUGGESTION_RE.sub(replace_match, content)
         log.info("Finished processing link suggestions.")
         return modified_content
     # --- END NEW ---
 
     # --- CORRECTED generate_content ---
-    def generate_content(self, brief):
+    def generate_content(self, brief, on_snippet=None):
         """Generates content using Claude based on the provided brief AND processes link suggestions.
-        Always returns a tuple with (content, error) for consistent handling."""
+        Always returns a tuple with (content, error) for consistent handling.
+
+        on_snippet, if given, is called with the first ~500 streamed characters of each attempt so callers
+        can start work that only needs the opening (e.g. the featured image) while the article finishes;
+        a later call means a retry replaced the earlier opening."""
         if not self.anthropic_client:
             log.error("Anthropic client not available for content generation.")
             return None, "Anthropic client not initialized"
@@ -916,7 +1368,8 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             return None, "Prompt generation failed"
 
         # 2. Call Claude API with rate limiting and retries
-        self._apply_rate_limiting()
+        self._apply_rate_limiting(len(prompt) // 4 + self.claude_max_tokens)
+        system_prompt = f"You are an expert SEO content writer. Write a comprehensive, engaging blog post. CRITICAL: The article MUST be EXACTLY {target_w_count} words long. Use HTML for formatting (h2, h3, p, ul, li, strong). Do not include an H1 title. Start directly with the first H2 section. Count your words."
         retries = 0
         content_raw = None # Store the raw content from Claude
         last_error = None
@@ -925,30 +1378,54 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
         while retries <= self.max_retries:
             try:
                 log.info(f"Generating content for '{keyword}' (Attempt {retries+1}/{self.max_retries+1}, Target: {target_w_count} words)")
-                system_prompt = f"You are an expert SEO content writer. Write a comprehensive, engaging blog post. CRITICAL: The article MUST be EXACTLY {target_w_count} words long. Use HTML for formatting (h2, h3, p, ul, li, strong). Do not include an H1 title. Start directly with the first H2 section. Count your words."
 
-                message = self.anthropic_client.messages.create(
+                # Stream the article so an obvious refusal can be abandoned after the first ~150 chars
+                chunks = []
+                head_len = 0
+                streamed_len = 0
+                snippet_sent = False # on_snippet fires once per attempt
+                with self.anthropic_client.messages.stream(
                     model=self.claude_model,
                     max_tokens=self.claude_max_tokens,
                     temperature=0.3,
                     system=system_prompt,
                     messages=[{"role": "user", "content": prompt}]
-                )
-                content_raw = message.content[0].text.strip() # Store raw content
+                ) as stream:
+                    for text in stream.text_stream:
+                        chunks.append(text)
+                        if head_len < 150:
+                            head_len += len(text)
+                            if head_len >= 150:
+                                head = ''.join(chunks).lstrip().lower()
+                                if "sorry" in head[:100] or "cannot fulfill" in head[:150]:
+                                    log.warning("Generated content looks like a refusal; aborting stream early.")
+                                    raise ValueError("Generated content potentially invalid or refused.")
+                        if on_snippet is not None and not snippet_sent:
+                            streamed_len += len(text)
+                            if streamed_len >= 500:
+                                snippet_sent = True
+                                try:
+                                    on_snippet(''.join(chunks).strip()[:500])
+                                except Exception as cb_err:
+                                    log.error(f"on_snippet callback failed for '{keyword}': {cb_err}", exc_info=True)
+                content_raw = ''.join(chunks).strip() # Store raw content
                 final_content_for_processing = content_raw # Update best content so far
-                actual_w_count = len(content_raw.split())
+                actual_w_count = _word_count(content_raw)
                 log.info(f"Claude generated content with {actual_w_count} words.")
 
                 # Basic validity check
-                if actual_w_count < 100 or "sorry" in content_raw.lower()[:100] or "cannot fulfill" in content_raw.lower()[:150]:
+                head = content_raw[:150].lower() # Only the opening matters; don't lowercase the whole article
+                if actual_w_count < 100 or "sorry" in head[:100] or "cannot fulfill" in head:
                     log.warning("Generated content seems too short or is an error message.")
                     raise ValueError("Generated content potentially invalid or refused.")
 
                 # Word count check
                 if actual_w_count >= target_w_count * 0.9:
                     log.info("Content meets word count threshold.")
-                    # Link processing happens AFTER successful generation
-                    processed_content = self._process_claude_link_suggestions(content_raw, keyword)
+                    # Link processing happens AFTER successful generation (only if Claude left suggestion markers)
+                    processed_content = content_raw
+                    if 'link-opportunity' in content_raw:
+                        processed_content = self._process_claude_link_suggestions(content_raw, keyword, self._get_category_mapping())
                     return processed_content, None # Return PROCESSED content on success
                 else:
                     log.warning(f"Generated content word count ({actual_w_count}) is below target ({target_w_count}). Retrying if possible.")
@@ -962,7 +1439,7 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             except anthropic.RateLimitError as e: 
                 last_error = f"Anthropic rate limit exceeded: {e}"
                 log.warning(last_error)
-                time.sleep((2 ** retries) * 5 + random.uniform(0, 5))
+                time.sleep(self._anthropic_rate_limit_wait(e, retries)) # Honor retry-after for rate limits
             except anthropic.APIStatusError as e: 
                 last_error = f"Anthropic API status error ({e.status_code}): {e.response}"
                 log.error(last_error)
@@ -986,7 +1463,9 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
                 # If all retries failed but we got *some* content, process and return it with the error
                 if final_content_for_processing:
                     log.warning("Returning last generated content despite failing retries/word count.")
-                    processed_content = self._process_claude_link_suggestions(final_content_for_processing, keyword)
+                    processed_content = final_content_for_processing
+                    if 'link-opportunity' in final_content_for_processing:
+                        processed_content = self._process_claude_link_suggestions(final_content_for_processing, keyword, self._get_category_mapping())
                     return processed_content, last_error # Return content but signal the original error
                 else:
                     return None, last_error # Failed completely
@@ -1030,6 +1509,24 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             logging.error(f"Error in image generation/upload process for '{keyword}': {e}", exc_info=True)
             return None
 
+    def _save_category_draft(self, category_target, category_content: str, keyword: str, post_url: Optional[str]) -> Dict:
+        """Writes the category description plus a link to the blog post to the category's draft meta field."""
+        category_id, category_title = category_target
+        draft_meta_key = 'cave_supplies_longform_description_draft'
+        # Without a post URL (post creation failed) keep the placeholder for manual fix-up, as before
+        link_href = html.escape(post_url) if post_url else "BLOG_POST_PLACEHOLDER"
+        blog_reference = _BLOG_REF_TMPL.format(kw=html.escape(keyword), url=link_href)
+        try:
+            log.info(f"Attempting to save description to DRAFT field for category ID: {category_id} ('{category_title}')")
+            if self.wp_service.update_term_meta(category_id, draft_meta_key, category_content + "\n\n" + blog_reference):
+                log.info(f"Successfully saved category description to draft meta for category {category_id}.")
+                return {'status': 'draft_saved', 'id': category_id, 'title': category_title}
+            log.error(f"Failed to save category description draft meta for category {category_id} (update_term_meta returned false).")
+            return {'status': 'error', 'id': category_id, 'title': category_title, 'error': 'Failed to update term meta'}
+        except Exception as e_cat_save:
+            log.error(f"Error saving category draft meta for {category_id}: {e_cat_save}", exc_info=True)
+            return {'status': 'error', 'id': category_id, 'title': category_title, 'error': f'Exception during meta save: {e_cat_save}'}
+
     # --- CORRECTED post_content_to_wordpress ---
     def post_content_to_wordpress(self, brief: Dict, processed_content_result, featured_image_id=None):
         """
@@ -1081,10 +1578,11 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
         is_dual_content = (recommendation == 'dual_content')
         blog_content = processed_content # Default: assume processed content is the blog post
         category_content_to_save = None
+        category_target = None # (category_id, category_title) whose draft meta gets the category description
         category_update_result = {'status': 'not_applicable'} # Default
         post_meta_to_save = { # Base meta for the post
             '_content_brief_keyword': keyword,
-            '_content_brief_data': json.dumps(brief, default=str), # Serialize full brief
+            '_content_brief_data': _json_dumps(brief), # Serialize full brief
             '_acb_raw_category_content': '',
             '_acb_category_update_status': ''
         }
@@ -1094,21 +1592,22 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             # Attempt to parse category/blog content from the processed content if markers exist
             category_marker = "=== CATEGORY DESCRIPTION ==="
             blog_marker = "=== BLOG POST ==="
-            cat_start = processed_content.find(category_marker)
-            blog_start = processed_content.find(blog_marker)
+            _, found_cat, rest = processed_content.partition(category_marker)
+            category_chunk, found_blog, blog_chunk = rest.partition(blog_marker) # Blog marker must follow the category marker
 
-            if cat_start != -1 and blog_start != -1 and blog_start > cat_start:
+            if found_cat and found_blog:
                 log.info("Parsing dual content response based on markers.")
-                category_content_to_save = processed_content[cat_start + len(category_marker):blog_start].strip()
-                blog_content = processed_content[blog_start + len(blog_marker):].strip() # Override blog_content
+                category_content_to_save = category_chunk.strip()
+                blog_content = blog_chunk.strip() # Override blog_content
                 post_meta_to_save['_acb_raw_category_content'] = category_content_to_save # Store raw category content
-                log.debug(f"Category content length: {len(category_content_to_save.split())}, Blog content length: {len(blog_content.split())}")
+                log.debug(f"Category content length: {_word_count(category_content_to_save)}, Blog content length: {_word_count(blog_content)}")
             else:
                 log.warning("Dual content markers not found in processed content. Posting all as blog post.")
                 is_dual_content = False # Revert to single post flow
                 category_content_to_save = None
 
-            # If we successfully parsed category content, try saving it to draft meta
+            # If we successfully parsed category content, resolve the target category now;
+            # its draft meta is written once, after the blog post exists and its URL is known
             if is_dual_content and category_content_to_save:
                 update_targets = brief.get('update_targets', [])
                 if update_targets:
@@ -1118,32 +1617,10 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
 
                     if category_id and category_id != 'UNKNOWN':
                         try:
-                            category_id = int(category_id)
-                            draft_meta_key = 'cave_supplies_longform_description_draft'
-                            # Add placeholder BEFORE saving to draft
-                            blog_reference = f'<p>Learn more about {keyword} in our <a href="BLOG_POST_PLACEHOLDER" class="category-blog-link" data-keyword="{keyword}">detailed guide</a>.</p>'
-                            content_with_placeholder = category_content_to_save + "\n\n" + blog_reference
-
-                            log.info(f"Attempting to save description to DRAFT field for category ID: {category_id} ('{category_title}')")
-                            # Check if update_term_meta exists on wp_service
-                            if hasattr(self.wp_service, 'update_term_meta') and callable(self.wp_service.update_term_meta):
-                                updated = self.wp_service.update_term_meta(category_id, draft_meta_key, content_with_placeholder)
-                                if updated:
-                                    log.info(f"Successfully saved category description to draft meta for category {category_id}.")
-                                    category_update_result = {'status': 'draft_saved', 'id': category_id, 'title': category_title}
-                                else:
-                                    log.error(f"Failed to save category description draft meta for category {category_id} (update_term_meta returned false).")
-                                    category_update_result = {'status': 'error', 'id': category_id, 'title': category_title, 'error': 'Failed to update term meta'}
-                            else:
-                                log.error("WordPressService does not have an 'update_term_meta' method implemented.")
-                                category_update_result = {'status': 'error', 'id': category_id, 'title': category_title, 'error': 'update_term_meta method missing'}
-
+                            category_target = (int(category_id), category_title)
                         except ValueError:
                             log.error(f"Invalid category ID format in update_targets: {category_id}")
                             category_update_result = {'status': 'error', 'error': 'Invalid category ID'}
-                        except Exception as e_cat_save:
-                            log.error(f"Error saving category draft meta for {category_id}: {e_cat_save}", exc_info=True)
-                            category_update_result = {'status': 'error', 'id': category_id, 'title': category_title, 'error': f'Exception during meta save: {e_cat_save}'}
                     else:
                         log.warning("Cannot update category draft field: Category ID is missing or UNKNOWN.")
                         category_update_result = {'status': 'error', 'error': 'Missing category ID'}
@@ -1158,14 +1635,13 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             # Generate simple title
             title = f"{keyword.title()}: The Ultimate Guide"
 
-            # Add category reference link to blog post if dual content was successful so far
-            if category_update_result.get('status') == 'draft_saved':
-                category_id_for_link = category_update_result.get('id')
+            # Add category reference link to blog post if we have a target category
+            if category_target:
+                category_id_for_link = category_target[0]
                 # Attempt to get category slug/URL (needs enhancement in wp_service or use placeholder)
                 category_page_url = self.wp_service.get_term_link(category_id_for_link, 'product_cat') # Assumes get_term_link exists
                 if category_page_url:
-                    category_reference = f'<p>Explore our full collection of <a href="{html.escape(category_page_url)}">{keyword}</a> at Cave Supplies.</p>\n\n'
-                    blog_content = category_reference + blog_content
+                    blog_content = _CATEGORY_REF_TMPL.format(kw=html.escape(keyword), url=html.escape(category_page_url)) + blog_content
                 else:
                     log.warning(f"Could not get URL for category {category_id_for_link} to add link to blog post.")
 
@@ -1183,46 +1659,22 @@ Respond ONLY with the integer number (e.g., 1500, 2000, 2500, 3000)."""
             log.info(f"Creating draft blog post: '{title}'...")
             post_result = self.wp_service.create_post(post_payload, rest_base='posts') # Target 'posts' endpoint
 
+            post_url = None
             if post_result and post_result.get('id'):
                 post_id = post_result['id']
                 post_url = post_result.get('link', '')
                 log.info(f"Successfully created draft post ID: {post_id} for keyword '{keyword}'.")
                 final_result['blog_post'] = {'status': 'success', 'id': post_id, 'url': post_url}
-
-                # --- Update category draft meta with actual blog post URL ---
-                if category_update_result.get('status') == 'draft_saved':
-                    category_id_to_update = category_update_result['id']
-                    draft_meta_key = 'cave_supplies_longform_description_draft'
-                    # Re-fetch content with placeholder or replace in string? Replace is easier if format is known.
-                    # Requires the content_with_placeholder variable from earlier block
-                    try:
-                        # Ensure content_with_placeholder is accessible here (might need refactoring)
-                        # For now, assume category_content_to_save holds the text before the placeholder was added
-                        blog_reference_updated = f'<p>Learn more about {keyword} in our <a href="{html.escape(post_url)}" class="category-blog-link" data-keyword="{keyword}">detailed guide</a>.</p>'
-                        final_category_content = category_content_to_save + "\n\n" + blog_reference_updated
-
-                        log.info(f"Updating category {category_id_to_update} draft meta with final blog post URL.")
-                        if hasattr(self.wp_service, 'update_term_meta') and callable(self.wp_service.update_term_meta):
-                            if self.wp_service.update_term_meta(category_id_to_update, draft_meta_key, final_category_content):
-                                log.info("Successfully updated category draft meta with blog URL.")
-                            else:
-                                log.error("Failed to update category draft meta with blog URL (update_term_meta returned false).")
-                                final_result['category_update']['error'] = final_result['category_update'].get('error', '') + '; Failed URL update'
-                        else:
-                            log.error("WordPressService does not have 'update_term_meta' method.")
-                            final_result['category_update']['error'] = final_result['category_update'].get('error', '') + '; update_term_meta missing'
-
-                    except NameError: # content_with_placeholder might not be defined if initial save failed
-                        log.error("Cannot update category placeholder link - initial content variable missing.")
-                        final_result['category_update']['error'] = final_result['category_update'].get('error', '') + '; Failed URL update (variable missing)'
-                    except Exception as e_update_link:
-                        log.error(f"Error updating category placeholder link: {e_update_link}", exc_info=True)
-                        final_result['category_update']['error'] = final_result['category_update'].get('error', '') + f'; Failed URL update ({e_update_link})'
-                # ---
             else:
                 log.error(f"Failed to create WordPress post for keyword '{keyword}'. Response: {post_result}")
                 final_result['blog_post'] = {'status': 'error', 'response': post_result}
 
+            # --- Save category description (with the blog post link) to draft meta: one write ---
+            if category_target:
+                category_update_result = self._save_category_draft(category_target, category_content_to_save, keyword, post_url)
+                final_result['category_update'] = category_update_result
+            # ---
+
             return final_result
 
         except Exception as e:
@@ -0,0 +1,66 @@
+from unittest import mock
+
+from services.content_analyzer import ContentAnalyzer
+from services.workflow import ContentWorkflowService
+
+KEYWORD = "home bar stools"
+URLS = [f"https://competitor{i}.example/bar-stools" for i in range(3)]
+
+
+def _competitor_page(extra_words):
+    body = " ".join(["stool"] * extra_words)
+    return f"""<html><head><title>Bar stools</title><script>var x = "ignored words";</script></head>
+    <body><nav>Home Shop Cart</nav>
+    <h2>Choosing The Right Height</h2><p>{body}</p>
+    <h2>Materials And Finishes</h2><p>{body}</p>
+    <h3>How tall should a home bar stool be?</h3><p>Most counters need a 24 inch seat.</p>
+    <footer>Copyright</footer></body></html>"""
+
+
+def _analyzer():
+    with mock.patch.object(ContentAnalyzer, '_initialize_nltk'):
+        analyzer = ContentAnalyzer({}, db_connection_func=None)
+    analyzer.get_top_ranking_urls = mock.Mock(return_value=[{'url': url} for url in URLS])
+    pages = dict(zip(URLS, [_competitor_page(300), _competitor_page(500), None]))
+    analyzer._fetch_page_html = mock.Mock(side_effect=pages.get)
+    return analyzer
+
+
+def test_page_signals_skip_chrome_and_collect_headings():
+    signals = ContentAnalyzer.page_signals_from_html(_competitor_page(10))
+    assert signals['headings'] == ["Choosing The Right Height", "Materials And Finishes",
+                                   "How tall should a home bar stool be?"]
+    assert "ignored" not in signals['text'] and "Copyright" not in signals['text']
+
+
+def test_analyzer_returns_competitor_signals():
+    analysis = _analyzer().analyze_competitor_content(KEYWORD)
+    assert analysis['successful_scrape_count'] == 2
+    assert analysis['avg_word_count'] > 600
+    assert "Choosing The Right Height" in analysis['content_structure']
+    assert analysis['faq_questions'] == ["How tall should a home bar stool be?"]
+
+
+def test_competitor_signals_suppress_ai_fallbacks():
+    analysis = _analyzer().analyze_competitor_content(KEYWORD)
+    # One more FAQ so both structure and FAQ hints clear the two-item threshold
+    analysis['faq_questions'].append("What seat height suits a 42 inch bar?")
+
+    service = ContentWorkflowService.__new__(ContentWorkflowService)
+    service.analyzer = mock.Mock()
+    service.analyzer.analyze_competitor_content.return_value = analysis
+    service._get_ai_structure = mock.Mock()
+    service._get_ai_faqs = mock.Mock()
+    service._get_ai_word_count = mock.Mock()
+    service._get_ai_keywords = mock.Mock()
+    service._fetch_ke_keywords = mock.AsyncMock(return_value=([], [], [["bar stool height", "counter stool"]] * 2))
+    service._generate_claude_prompt = mock.Mock(return_value="prompt")
+
+    brief = service.generate_content_brief({'query': KEYWORD, '_cached_categories': [], '_cached_category_mapping': {}})
+
+    service._get_ai_structure.assert_not_called()
+    service._get_ai_faqs.assert_not_called()
+    service._get_ai_word_count.assert_not_called()
+    assert brief['content_structure'] == analysis['content_structure']
+    assert brief['faq_questions'] == analysis['faq_questions']
+    assert brief['target_word_count'] == min(max(1000, int(round(analysis['avg_word_count'], -2))), 5000)
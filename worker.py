@@ -1,10 +1,18 @@
 # worker.py
 import os
 import logging
+import logging.handlers
+import queue
+import atexit
+import signal
 import time
 import requests
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import random # For jitter
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv # Import load_dotenv
 import sys # For printing to stderr during debug and sys.exit
 from datetime import datetime
@@ -64,23 +72,243 @@ from services.wordpress import WordPressService # Needs updated __init__
 from services.workflow import ContentWorkflowService # Needs updated __init__
 
 
-# Configure logging (logs to file and console)
+# Logging goes to file and console; configured by setup_logging() when run as a script,
+# so importing this module (tests, one-off scripts) leaves the caller's logging alone.
 LOG_FILE = '/home/eslobrown/seobot/worker_always_on.log'
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - [%(funcName)s] - %(message)s', # Added funcName
-    handlers=[
-        logging.FileHandler(LOG_FILE), # Log to file
-        logging.StreamHandler(sys.stdout) # Log to stdout (visible in Always-On Task console/log)
-    ]
-)
 log = logging.getLogger(__name__)
 
 
+def setup_logging():
+    """Routes root logging through a queue; a QueueListener thread does the file/stdout writes."""
+    log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(funcName)s] - %(message)s') # Added funcName
+    log_file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=50_000_000, backupCount=5) # Log to file
+    log_file_handler.setFormatter(log_formatter)
+    log_stream_handler = logging.StreamHandler(sys.stdout) # Log to stdout (visible in Always-On Task console/log)
+    log_stream_handler.setFormatter(log_formatter)
+    log_queue = queue.SimpleQueue()
+    log_queue_handler = logging.handlers.QueueHandler(log_queue)
+    log_queue_handler.setFormatter(logging.Formatter('%(message)s')) # Merges args/traceback only; listener handlers add the layout
+    # force=True: database.py's basicConfig already ran on import and would otherwise make this a no-op
+    logging.basicConfig(level=logging.INFO, handlers=[log_queue_handler], force=True)
+    log_listener = logging.handlers.QueueListener(log_queue, log_file_handler, log_stream_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop) # Flushes queued records on exit
+    return log_listener
+
+
 # --- Worker Functions ---
 
-def process_single_task(task):
-    """Processes a single generation task."""
+# Callbacks are safe to repeat, so unlike the shared WP adapter (which must not replay post creation)
+# their adapter retries POSTs on 429/5xx (honoring Retry-After) instead of failing the whole task.
+CALLBACK_RETRY = Retry(total=5, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504],
+                       allowed_methods=frozenset(['POST']), respect_retry_after_header=True)
+
+# Featured images are generated alongside the article (see process_single_task); one slot per concurrent task
+_image_executor = ThreadPoolExecutor(max_workers=max(1, int(config.WORKER_CONFIG.get('concurrency', 4))), thread_name_prefix='image')
+
+def _build_callback_session():
+    """Keep-alive session for WordPress callbacks, with the POST-retrying adapter mounted up front."""
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=CALLBACK_RETRY)
+    # Mounted once, here: the shared WP session is never re-mounted while task threads use it
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+_callback_http = _build_callback_session() # drain_pending_callbacks and inline delivery; CallbackDispatcher has its own
+
+
+def _featured_image_result(future, task_id):
+    """Attachment ID from a featured image job, or None; the job's exception is logged, not raised."""
+    try:
+        return future.result()
+    except Exception as img_err:
+        log.error(f"Featured image generation failed for task {task_id}: {img_err}", exc_info=True)
+        return None
+
+
+def _discard_featured_image(wp_service, future, task_id):
+    """
+    Drops a featured image job whose article attempt didn't make it: cancels it if it hasn't started,
+    otherwise deletes the uploaded attachment once the job finishes (without waiting for it here).
+    """
+    if future.cancel():
+        return
+    def _cleanup(done):
+        attachment_id = _featured_image_result(done, task_id)
+        if attachment_id and wp_service.delete_media(attachment_id):
+            log.info(f"Deleted unused featured image {attachment_id} for task {task_id}")
+    future.add_done_callback(_cleanup)
+
+
+def send_callback(session, callback_url, data):
+    """POSTs a callback payload to WordPress over `session` (with CALLBACK_RETRY); raises on failure."""
+    # WP credentials were read from the environment once, at config import
+    wp_user = config.WP_CONFIG.get('api_user')
+    wp_pass = config.WP_CONFIG.get('api_password')
+    if not wp_user or not wp_pass:
+         raise ValueError("Missing WP API credentials for callback.")
+    response = session.post(
+        callback_url,
+        json=data,
+        headers={'Content-Type': 'application/json'},
+        auth=(wp_user, wp_pass),
+        timeout=60
+    )
+    response.raise_for_status()
+    return response
+
+
+def _deliver_callback(session, job):
+    """Sends one callback job over `session`; on failure queues it in pending_callbacks (see drain_pending_callbacks)."""
+    task_id, callback_url, data, final_task_status, will_retry = job
+    try:
+        response = send_callback(session, callback_url, data)
+        log.info(f"Callback successful for task {task_id} (WP Status: {response.status_code})")
+    except (requests.exceptions.RequestException, ValueError) as cb_err:
+        # CALLBACK_RETRY already retried transient errors. Queue the delivery instead of failing
+        # the task, so a WordPress hiccup never makes the task (and its Claude call) run again.
+        if will_retry:
+            log.warning(f"Callback failed for task {task_id}: {cb_err}. Not queued; the task's retry will send a fresh callback.")
+        elif database.add_pending_callback(task_id, callback_url, data):
+            log.warning(f"Callback failed for task {task_id}: {cb_err}. Queued for redelivery.")
+            if final_task_status == 'completed':
+                database.update_task_status(task_id, 'callback_pending',
+                                            error_message=f"Processing status was '{data['status']}', callback queued for redelivery: {cb_err}")
+        else:
+            # Not even queued. Never send the task back through the retry path ('error' is reclaimable
+            # and would regenerate/re-bill published content): 'callback_failed' is terminal, and loud
+            log.critical(f"Callback for task {task_id} failed ({cb_err}) and could not be queued for redelivery. "
+                         f"WordPress must be notified manually (brief {data.get('brief_id')}).")
+            if final_task_status == 'completed':
+                database.update_task_status(task_id, 'callback_failed',
+                                            error_message=f"Processing status was '{data['status']}', but callback failed and could not be queued: {cb_err}")
+
+
+class CallbackDispatcher(threading.Thread):
+    """Delivers WordPress callbacks from a bounded queue so task threads don't wait on callback RTT."""
+
+    def __init__(self, maxsize=1024):
+        super().__init__(name='callback-dispatcher', daemon=True)
+        self.jobs = queue.Queue(maxsize=maxsize) # put() blocks when full: backpressure on task threads
+        self.session = _build_callback_session() # Only this thread posts through it
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None: # stop() sentinel; everything queued before it has been delivered
+                break
+            try:
+                _deliver_callback(self.session, job)
+            except Exception as cb_err:
+                log.exception(f"Unexpected error delivering callback for task {job[0]}: {cb_err}")
+
+    def stop(self):
+        """Delivers the callbacks already queued, then ends the thread."""
+        self.jobs.put(None)
+        self.join()
+        self.session.close()
+
+
+_callback_dispatcher = None # Started in __main__
+
+def dispatch_callback(job):
+    """Hands a callback job to the dispatcher thread, or delivers it inline if none is running."""
+    if _callback_dispatcher is not None and _callback_dispatcher.is_alive():
+        _callback_dispatcher.jobs.put(job)
+    else:
+        _deliver_callback(_callback_http, job)
+
+
+def drain_pending_callbacks(services, limit=20):
+    """Redelivers callbacks queued by process_single_task after WordPress rejected them."""
+    pending = database.get_pending_callbacks(limit=limit)
+    if not pending:
+        return 0
+    delivered = 0
+    for cb in pending:
+        try:
+            send_callback(_callback_http, cb['callback_url'], cb['payload'])
+            database.resolve_pending_callback(cb['id'])
+            database.update_task_status(cb['task_id'], 'completed' if cb['payload'].get('status') == 'success' else 'error',
+                                        error_message=cb['payload'].get('error_message'))
+            delivered += 1
+        except Exception as cb_err:
+            log.warning(f"Redelivery of queued callback {cb['id']} (task {cb['task_id']}) failed: {cb_err}")
+            database.resolve_pending_callback(cb['id'], error_message=str(cb_err))
+    log.info(f"Redelivered {delivered}/{len(pending)} queued callback(s).")
+    return delivered
+
+
+def build_services():
+    """
+    Creates the WordPress, Imagen, ContentAnalyzer and workflow services used by process_single_task.
+    Called once at worker startup so every task shares the same HTTP session, DB pools and
+    Anthropic rate-limit buckets. Raises ValueError on missing credentials/config.
+    """
+    # --- WP variables (read from the environment once, at config import) ---
+    wp_api_url = config.WP_CONFIG.get('api_url')
+    wp_api_user = config.WP_CONFIG.get('api_user')
+    wp_api_password = config.WP_CONFIG.get('api_password')
+    log.info(f"DEBUG: PRE-INIT CHECK: WP_API_URL = {wp_api_url}")
+    log.info(f"DEBUG: PRE-INIT CHECK: WP_API_USER = {wp_api_user}")
+    log.info(f"DEBUG: PRE-INIT CHECK: WP_API_APP_PASSWORD = {'********' if wp_api_password else None}")
+    if not wp_api_url or not wp_api_user or not wp_api_password:
+         raise ValueError("WP Credentials check failed during service initialization.")
+    # Pass individual vars to WordPressService (ensure its __init__ expects these)
+    wp_service = WordPressService(
+        wp_api_url, 
+        wp_api_user, 
+        wp_api_password, 
+        db_connection_func=database.get_db_connection,  # For PythonAnywhere DB
+        wp_db_connection_func=database.get_wordpress_db_connection  # For WordPress DB
+    )
+
+    # --- Anthropic variables (same env vars and defaults, parsed once in config.ANTHROPIC_CONFIG) ---
+    anthropic_key = config.ANTHROPIC_CONFIG.get('api_key')
+    anthropic_model = config.ANTHROPIC_CONFIG.get('model')
+    anthropic_max_tokens = config.ANTHROPIC_CONFIG.get('max_tokens')
+    anthropic_rate_limit = config.ANTHROPIC_CONFIG.get('rate_limit_per_minute')
+    anthropic_max_retries = config.ANTHROPIC_CONFIG.get('max_retries')
+    anthropic_tpm_limit = config.ANTHROPIC_CONFIG.get('tokens_per_minute')
+    log.info(f"DEBUG: Read ANTHROPIC_API_KEY = {'********' if anthropic_key else None}")
+    if not anthropic_key:
+         raise ValueError("ANTHROPIC_API_KEY check failed during service initialization.")
+    # ---
+
+    # Initialize other services using config dictionaries
+    gemini_key = config.GOOGLE_CONFIG.get('gemini_api_key')
+    gemini_model = config.GOOGLE_CONFIG.get('gemini_image_model')
+    if not gemini_key: raise ValueError("Missing GEMINI_API_KEY from config")
+    imagen_client = ImagenClient(gemini_key, gemini_model)
+
+    # Pass necessary Google config parts to ContentAnalyzer if needed
+    content_analyzer = ContentAnalyzer(config.GOOGLE_CONFIG, database.get_db_connection, wp_service)
+
+    # Pass individual Anthropic vars to ContentWorkflowService
+    # (Ensure ContentWorkflowService.__init__ expects these specific args)
+    workflow_service = ContentWorkflowService(
+        anthropic_api_key=anthropic_key,
+        anthropic_model=anthropic_model,
+        anthropic_max_tokens=anthropic_max_tokens,
+        anthropic_rate_limit=anthropic_rate_limit,
+        anthropic_max_retries=anthropic_max_retries,
+        content_analyzer=content_analyzer,
+        imagen_client=imagen_client,
+        wordpress_service=wp_service,
+        anthropic_tpm_limit=anthropic_tpm_limit
+    )
+    log.info("Services initialized successfully.")
+    return {
+        'wp_service': wp_service,
+        'imagen_client': imagen_client,
+        'content_analyzer': content_analyzer,
+        'workflow_service': workflow_service,
+    }
+
+
+def process_single_task(task, services=None):
+    """Processes a single generation task using the shared services from build_services()."""
     task_id = task.get('task_id', 'UNKNOWN_TASK_ID')
     payload = task.get('payload', {}) # Use .get for safety
     attempts = task.get('attempts', 0)
@@ -102,78 +330,27 @@ def process_single_task(task):
     # --- End Payload Validation ---
 
 
-    # Mark task as processing in DB
-    if not database.mark_task_processing(task_id, attempts):
+    # Mark task as processing in DB (tasks from claim_next_task already are)
+    if not task.get('claimed') and not database.mark_task_processing(task_id, attempts):
          log.warning(f"Failed to mark task {task_id} as processing (maybe already processed?). Skipping.")
          return
 
-    # --- Initialize Services ---
-    wp_service = None # Initialize to None
-    try:
-        # --- Get WP variables directly using os.getenv ---
-        wp_api_url = os.getenv('WP_API_URL')
-        wp_api_user = os.getenv('WP_API_USER')
-        wp_api_password = os.getenv('WP_API_APP_PASSWORD')
-        log.info(f"DEBUG [Task {task_id}]: PRE-INIT CHECK: WP_API_URL = {wp_api_url}")
-        log.info(f"DEBUG [Task {task_id}]: PRE-INIT CHECK: WP_API_USER = {wp_api_user}")
-        log.info(f"DEBUG [Task {task_id}]: PRE-INIT CHECK: WP_API_APP_PASSWORD = {'********' if wp_api_password else None}")
-        if not wp_api_url or not wp_api_user or not wp_api_password:
-             raise ValueError("WP Credentials check failed inside task processing.")
-        # Pass individual vars to WordPressService (ensure its __init__ expects these)
-        wp_service = WordPressService(
-            wp_api_url, 
-            wp_api_user, 
-            wp_api_password, 
-            db_connection_func=database.get_db_connection,  # For PythonAnywhere DB
-            wp_db_connection_func=database.get_wordpress_db_connection  # For WordPress DB
-)
-
-        # --- Get Anthropic variables directly ---
-        anthropic_key = os.getenv('ANTHROPIC_API_KEY')
-        anthropic_model = os.getenv('CLAUDE_MODEL', 'claude-3-haiku-20240307') # Use default from .env if not set
-        anthropic_max_tokens = int(os.getenv('CLAUDE_MAX_TOKENS', '8000'))
-        anthropic_rate_limit = int(os.getenv('CLAUDE_RATE_LIMIT_PER_MINUTE', '50'))
-        anthropic_max_retries = int(os.getenv('CLAUDE_MAX_RETRIES', '3'))
-        log.info(f"DEBUG [Task {task_id}]: Read ANTHROPIC_API_KEY = {'********' if anthropic_key else None}")
-        if not anthropic_key:
-             raise ValueError("ANTHROPIC_API_KEY check failed inside task processing.")
-        # ---
-
-        # Initialize other services using config dictionaries
-        gemini_key = config.GOOGLE_CONFIG.get('gemini_api_key')
-        gemini_model = config.GOOGLE_CONFIG.get('gemini_image_model')
-        if not gemini_key: raise ValueError("Missing GEMINI_API_KEY from config")
-        imagen_client = ImagenClient(gemini_key, gemini_model)
-
-        # Pass necessary Google config parts to ContentAnalyzer if needed
-        content_analyzer = ContentAnalyzer(config.GOOGLE_CONFIG, database.get_db_connection, wp_service)
-
-        # Pass individual Anthropic vars to ContentWorkflowService
-        # (Ensure ContentWorkflowService.__init__ expects these specific args)
-        workflow_service = ContentWorkflowService(
-            anthropic_api_key=anthropic_key,
-            anthropic_model=anthropic_model,
-            anthropic_max_tokens=anthropic_max_tokens,
-            anthropic_rate_limit=anthropic_rate_limit,
-            anthropic_max_retries=anthropic_max_retries,
-            content_analyzer=content_analyzer,
-            imagen_client=imagen_client,
-            wordpress_service=wp_service
-        )
-        # --- End Service Initialization ---
-
-        log.info(f"Services initialized successfully for task {task_id}")
-
-    except ValueError as ve: # Catch specific credential/config errors during init
-         error_msg = f"Failed to initialize services for task {task_id}: {ve}"
-         log.error(error_msg)
-         database.update_task_status(task_id, 'error', error_message=str(ve)) # Store specific error
-         return # Stop processing this task
-    except Exception as init_err: # Catch other potential init errors
-         error_msg = f"Unexpected error initializing services for task {task_id}: {init_err}"
-         log.error(error_msg, exc_info=True) # Log full traceback
-         database.update_task_status(task_id, 'error', error_message=error_msg)
-         return # Stop processing this task
+    # --- Services (built once at worker startup; per-task only for direct callers) ---
+    if services is None:
+        try:
+            services = build_services()
+        except ValueError as ve: # Catch specific credential/config errors during init
+             error_msg = f"Failed to initialize services for task {task_id}: {ve}"
+             log.error(error_msg)
+             database.update_task_status(task_id, 'error', error_message=str(ve)) # Store specific error
+             return # Stop processing this task
+        except Exception as init_err: # Catch other potential init errors
+             error_msg = f"Unexpected error initializing services for task {task_id}: {init_err}"
+             log.error(error_msg, exc_info=True) # Log full traceback
+             database.update_task_status(task_id, 'error', error_message=error_msg)
+             return # Stop processing this task
+    workflow_service = services['workflow_service']
+    wp_service = services['wp_service']
 
 
     # --- Execute Task Logic ---
@@ -181,7 +358,6 @@ def process_single_task(task):
         'brief_id': payload['brief_id'],
         'task_id': task_id,
         'status': 'error', # Default
-        'generated_content': None,
         'featured_image_id': None,
         'generated_post_id': None, # Add placeholder
         'generated_post_url': None, # <-- ADD PLACEHOLDER
@@ -189,6 +365,7 @@ def process_single_task(task):
     }
     start_time = time.time()
     final_task_status = 'error'
+    image_futures = [] # The featured image job for the current article attempt (at most one)
 
     try:
         if task.get('task_type') == 'generate_content':
@@ -200,19 +377,35 @@ def process_single_task(task):
                 'target_word_count': payload['target_word_count'],
                 # Include other necessary fields if _generate_claude_prompt needs them
             }
+            # Start the featured image as soon as the article's opening streams in, so Imagen
+            # runs while Claude is still writing rather than after it. generate_content calls this
+            # once per attempt; a retry's opening replaces the earlier attempt's image.
+            def start_featured_image(snippet):
+                if image_futures:
+                    _discard_featured_image(wp_service, image_futures.pop(), task_id)
+                log.info(f"Generating featured image for task {task_id}")
+                image_futures.append(_image_executor.submit(
+                    workflow_service.generate_and_upload_featured_image, payload['keyword'], snippet
+                ))
+
             # Call the generation function within workflow service
-            generated_content, gen_error = workflow_service.generate_content(mock_brief)
+            generated_content, gen_error = workflow_service.generate_content(mock_brief, on_snippet=start_featured_image)
 
-            if generated_content:
+            if not generated_content:
+                 # Content generation failed: nothing to post
+                 callback_payload['error_message'] = f"Content generation failed: {gen_error}" # Use error from generate_content
+                 log.error(f"Content generation failed for task {task_id}: {gen_error}")
+                 final_task_status = 'error'
+                 # Any image started from a streamed opening has no article to go with
+                 if image_futures:
+                      _discard_featured_image(wp_service, image_futures.pop(), task_id)
+            else:
                 log.info(f"Content generated successfully for task {task_id}.")
-                callback_payload['generated_content'] = generated_content
 
-                # --- Generate Featured Image ---
-                log.info(f"Generating featured image for task {task_id}")
-                content_snippet = generated_content[:500]
-                featured_image_id = workflow_service.generate_and_upload_featured_image(
-                    payload['keyword'], content_snippet
-                )
+                # --- Featured Image (usually already running since the stream's first 500 chars) ---
+                if not image_futures: # Stream ended before 500 chars
+                    start_featured_image(generated_content[:500])
+                featured_image_id = _featured_image_result(image_futures.pop(), task_id)
                 callback_payload['featured_image_id'] = featured_image_id
                 if featured_image_id:
                      log.info(f"Featured image generated/uploaded (ID: {featured_image_id}) for task {task_id}")
@@ -221,45 +414,34 @@ def process_single_task(task):
 
                 # --- Create WordPress Post with Generated Content ---
                 log.info(f"Creating WordPress post for task {task_id}")
-                mock_brief = {
-                    'keyword': payload['keyword'],
-                    'target_word_count': payload['target_word_count']
-                    # Add other necessary fields
-                }
                 post_result = workflow_service.post_content_to_wordpress(
                     mock_brief, generated_content, featured_image_id
                 )
-
-            if post_result and post_result.get('blog_post', {}).get('status') == 'success':
-                blog_post_info = post_result['blog_post']
-                callback_payload['generated_post_id'] = blog_post_info.get('id')
-                callback_payload['generated_post_url'] = blog_post_info.get('url') # <-- CAPTURE URL
-                log.info(f"Created WordPress post ID: {blog_post_info.get('id')} with URL: {blog_post_info.get('url')}")
-                # Mark overall success if post created
-                callback_payload['status'] = 'success'
-                callback_payload['error_message'] = None
-                final_task_status = 'completed'
-
-                # Handle category update status from result if needed
-                category_update_info = post_result.get('category_update', {})
-                if category_update_info.get('status') == 'error':
-                    log.warning(f"Category update part failed: {category_update_info.get('error')}")
-                    # Decide if this should downgrade overall status? For now, keep 'completed' if post was made.
-                    # callback_payload['status'] = 'partial_error' # Example status
-                    callback_payload['error_message'] = f"Blog post created, but category update failed: {category_update_info.get('error')}"
-
-
-            elif post_result and post_result.get('blog_post', {}).get('status') == 'error':
-                 # Blog post creation specifically failed
-                 error_detail = post_result['blog_post'].get('error', 'Unknown WP error')
-                 callback_payload['error_message'] = f"Content generated, but WP post creation failed: {error_detail}"
-                 log.error(f"Failed to create WordPress post for task {task_id}: {error_detail}")
-                 final_task_status = 'error'
-            else:
-                 # Content generation failed earlier
-                 callback_payload['error_message'] = f"Content generation failed: {gen_error}" # Use error from generate_content
-                 log.error(f"Content generation failed for task {task_id}: {gen_error}")
-                 final_task_status = 'error'
+                generated_content = None # The article lives in WordPress now; don't hold it through the callback
+
+                if post_result and post_result.get('blog_post', {}).get('status') == 'success':
+                    blog_post_info = post_result['blog_post']
+                    callback_payload['generated_post_id'] = blog_post_info.get('id')
+                    callback_payload['generated_post_url'] = blog_post_info.get('url') # <-- CAPTURE URL
+                    log.info(f"Created WordPress post ID: {blog_post_info.get('id')} with URL: {blog_post_info.get('url')}")
+                    # Mark overall success if post created
+                    callback_payload['status'] = 'success'
+                    callback_payload['error_message'] = None
+                    final_task_status = 'completed'
+
+                    # Handle category update status from result if needed
+                    category_update_info = post_result.get('category_update', {})
+                    if category_update_info.get('status') == 'error':
+                        log.warning(f"Category update part failed: {category_update_info.get('error')}")
+                        # Decide if this should downgrade overall status? For now, keep 'completed' if post was made.
+                        # callback_payload['status'] = 'partial_error' # Example status
+                        callback_payload['error_message'] = f"Blog post created, but category update failed: {category_update_info.get('error')}"
+                else:
+                     # Blog post creation failed (error status, or no result at all)
+                     error_detail = (post_result or {}).get('blog_post', {}).get('error', 'Unknown WP error')
+                     callback_payload['error_message'] = f"Content generated, but WP post creation failed: {error_detail}"
+                     log.error(f"Failed to create WordPress post for task {task_id}: {error_detail}")
+                     final_task_status = 'error'
 
         else:
             # Handle unknown task types
@@ -276,126 +458,137 @@ def process_single_task(task):
         final_task_status = 'error'
 
     finally:
-        # --- Send Callback to WordPress ---
-        callback_url = payload.get('callback_url', config.WP_CONFIG.get('callback_url'))
-        if callback_url:
-            log.info(f"Sending callback for task {task_id} to {callback_url} with final task status '{final_task_status}' and callback status '{callback_payload['status']}'")
-            try:
-                headers = {'Content-Type': 'application/json'}
-                # Re-check WP credentials directly from environment for callback safety
-                wp_user = os.getenv('WP_API_USER')
-                wp_pass = os.getenv('WP_API_APP_PASSWORD')
-                if not wp_user or not wp_pass:
-                     raise ValueError("Missing WP API credentials for callback.")
-
-                auth = (wp_user, wp_pass)
-
-                wp_callback_data = {
-                     'brief_id': callback_payload['brief_id'],
-                     'task_id': callback_payload['task_id'],
-                     'status': callback_payload['status'],
-                     # Only send content if successful? Optional. Might be large.
-                     # 'generated_content': callback_payload.get('generated_content') if callback_payload.get('status') == 'success' else None,
-                     'generated_post_id': callback_payload.get('generated_post_id'),
-                     'generated_post_url': callback_payload.get('generated_post_url'), # <-- INCLUDE URL
-                     'featured_image_id': callback_payload.get('featured_image_id'),
-                     'error_message': callback_payload.get('error_message')
-                }
-                # Remove keys with None values before sending JSON
-                wp_callback_data_clean = {k: v for k, v in wp_callback_data.items() if v is not None}
-
-                response = requests.post(
-                    callback_url,
-                    json=wp_callback_data_clean, # Send cleaned data
-                    headers=headers,
-                    auth=auth,
-                    timeout=60
-                )
-                response.raise_for_status()
-                log.info(f"Callback successful for task {task_id} (WP Status: {response.status_code})")
-
-            except requests.exceptions.RequestException as req_err:
-                error_msg = f"Callback failed for task {task_id}: {req_err}"
-                log.error(error_msg)
-                final_task_status = 'error' # Mark task as error if callback failed
-                callback_payload['error_message'] = f"Processing status was '{callback_payload['status']}', but callback failed: {req_err}"
-
-            except ValueError as val_err: # Catch missing WP creds for callback
-                 error_msg = f"Callback failed for task {task_id}: {val_err}"
-                 log.error(error_msg)
-                 final_task_status = 'error'
-                 callback_payload['error_message'] = error_msg
+        # An unexpected error may have left an image job with no post to attach to
+        if image_futures:
+            _discard_featured_image(wp_service, image_futures.pop(), task_id)
 
-            except Exception as cb_err:
-                 error_msg = f"Unexpected error during callback for task {task_id}: {cb_err}"
-                 log.exception(error_msg)
-                 final_task_status = 'error'
-                 callback_payload['error_message'] = f"Callback error: {cb_err}"
-        else:
+        # --- Update Final Task Status in DB (at processing end, not after callback delivery) ---
+        callback_url = payload.get('callback_url', config.WP_CONFIG.get('callback_url'))
+        if not callback_url:
             log.error(f"No callback URL found for task {task_id}. Cannot notify WordPress. Marking task as '{final_task_status}' in DB.")
             # Keep final_task_status as determined by processing, but WP won't know
             callback_payload['error_message'] = "Missing callback URL in task payload"
-
-        # --- Update Final Task Status in DB ---
         database.update_task_status(
              task_id,
-             final_task_status, # 'completed' or 'error'
+             final_task_status, # 'completed' or 'error' (the dispatcher may move it to 'callback_pending' / 'callback_failed')
              error_message=callback_payload.get('error_message') # Log last relevant error
         )
+
+        # --- Send Callback to WordPress (delivered off this thread by the CallbackDispatcher) ---
+        if callback_url:
+            # Only the fields WordPress uses; optional ones are sent when set (the article itself never is)
+            wp_callback_data_clean = {
+                 'brief_id': callback_payload['brief_id'],
+                 'task_id': callback_payload['task_id'],
+                 'status': callback_payload['status'],
+            }
+            for key in ('generated_post_id', 'generated_post_url', 'featured_image_id', 'error_message'):
+                 if callback_payload[key] is not None:
+                      wp_callback_data_clean[key] = callback_payload[key]
+            # A failed task with attempts left will run again and send its own callback
+            will_retry = final_task_status == 'error' and attempts + 1 < config.WORKER_CONFIG.get('max_task_retries', 3)
+            log.info(f"Queueing callback for task {task_id} to {callback_url} with final task status '{final_task_status}' and callback status '{callback_payload['status']}'")
+            dispatch_callback((task_id, callback_url, wp_callback_data_clean, final_task_status, will_retry))
+
         end_time = time.time()
         log.info(f"Task {task_id} finished processing. Final DB status: '{final_task_status}'. Duration: {end_time - start_time:.2f}s")
 
 
-def run_worker_loop(sleep_interval=15):
-    """Main worker loop to fetch and process pending tasks continuously."""
+# Set by SIGTERM or SIGINT/Ctrl-C; the loop finishes its current batch and exits, and its sleep wakes immediately
+_shutdown = threading.Event()
+
+def _request_shutdown(signum, frame):
+    log.info(f"Signal {signum} received. Worker will stop after the current batch.")
+    _shutdown.set()
+
+
+def run_worker_loop(services, sleep_interval=15):
+    """Main worker loop to claim and process pending tasks continuously.
+
+    Tasks are claimed atomically (database.claim_next_task), up to WORKER_CONFIG['concurrency'] per
+    cycle, and processed on a thread pool since they are almost entirely network I/O. While the queue
+    has work the next batch is claimed right away; the worker only sleeps once the queue is empty.
+    """
     log.info("WORKER LOOP: Starting run_worker_loop function...")
     cycle_count = 0
+    concurrency = max(1, int(config.WORKER_CONFIG.get('concurrency', 4)))
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='task')
+    log.info(f"WORKER LOOP: Processing up to {concurrency} task(s) concurrently.")
 
-    while True:
+    while not _shutdown.is_set():
         cycle_count += 1
         log.info(f"WORKER LOOP: Cycle {cycle_count} - Top of loop.")
 
         tasks_processed_this_cycle = 0
-        pending_tasks = []
 
         try:
-            log.info(f"WORKER LOOP: Cycle {cycle_count} - Calling get_pending_tasks...")
-            tasks_limit = 1 # Process one task per cycle
-            pending_tasks = database.get_pending_tasks(limit=tasks_limit)
-            log.info(f"WORKER LOOP: Cycle {cycle_count} - get_pending_tasks returned {len(pending_tasks)} task(s).")
-
-            if pending_tasks:
-                task_to_process = pending_tasks[0]
-                log.info(f"WORKER LOOP: Cycle {cycle_count} - Processing task ID: {task_to_process.get('task_id', 'N/A')}")
-                process_single_task(task_to_process)
-                tasks_processed_this_cycle += 1
-                log.info(f"WORKER LOOP: Cycle {cycle_count} - Finished processing attempt for task.")
+            log.info(f"WORKER LOOP: Cycle {cycle_count} - Claiming up to {concurrency} task(s)...")
+            claimed_tasks = []
+            while len(claimed_tasks) < concurrency and not _shutdown.is_set():
+                task = database.claim_next_task()
+                if not task:
+                    break
+                claimed_tasks.append(task)
+
+            if claimed_tasks:
+                log.info(f"WORKER LOOP: Cycle {cycle_count} - Processing task ID(s): {', '.join(str(t.get('task_id', 'N/A')) for t in claimed_tasks)}")
+                futures = {executor.submit(process_single_task, t, services): t.get('task_id', 'N/A') for t in claimed_tasks}
+                try:
+                    wait(futures)
+                except KeyboardInterrupt: # Only reachable when the caller didn't install _request_shutdown for SIGINT
+                    log.info("KeyboardInterrupt received. Finishing in-flight tasks before stopping.")
+                    _shutdown.set()
+                    wait(futures) # Don't leave claimed tasks stuck in 'processing'
+                for future, task_id in futures.items():
+                    if future.exception():
+                        log.error(f"WORKER LOOP: Cycle {cycle_count} - Task {task_id} raised: {future.exception()}")
+                tasks_processed_this_cycle += len(claimed_tasks)
+                log.info(f"WORKER LOOP: Cycle {cycle_count} - Finished processing attempt for {tasks_processed_this_cycle} task(s).")
+                continue # Queue may still be hot: claim the next batch without sleeping
             else:
                 log.info(f"WORKER LOOP: Cycle {cycle_count} - No pending tasks found.")
+                drain_pending_callbacks(services) # Idle: redeliver callbacks WordPress rejected earlier
 
         except Exception as e:
             log.exception(f"WORKER LOOP: Cycle {cycle_count} - Critical error in main loop execution: {e}")
             # Optional: Add a longer sleep after a critical error
             # time.sleep(60)
 
-        # Wait before the next cycle
+        # Wait before the next cycle (Event.wait returns early on shutdown)
         try:
             jitter = random.uniform(-sleep_interval * 0.1, sleep_interval * 0.1)
             actual_sleep = max(5, sleep_interval + jitter)
             log.info(f"WORKER LOOP: Cycle {cycle_count} - Sleeping for {actual_sleep:.2f} seconds...")
-            time.sleep(actual_sleep)
+            _shutdown.wait(actual_sleep)
             # log.info(f"WORKER LOOP: Cycle {cycle_count} - Woke up from sleep.") # Can be noisy
         except KeyboardInterrupt:
              log.info("KeyboardInterrupt received. Stopping worker loop.")
-             break
+             _shutdown.set()
         except Exception as sleep_err:
              log.error(f"WORKER LOOP: Cycle {cycle_count} - Error during sleep: {sleep_err}. Sleeping for default interval.")
-             time.sleep(sleep_interval)
+             _shutdown.wait(sleep_interval)
+
+    log.info("WORKER LOOP: Shutting down thread pools...")
+    executor.shutdown(wait=True)
+    _image_executor.shutdown(wait=True)
 
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    setup_logging()
     log.info("WORKER SCRIPT: Starting execution (__name__ == '__main__').")
+    signal.signal(signal.SIGTERM, _request_shutdown) # Graceful stop under systemd / always-on task restarts
+    signal.signal(signal.SIGINT, _request_shutdown) # Ctrl-C too: in-flight tasks finish instead of being left 'processing'
     # Ensure the necessary service __init__ methods expect individual args where needed
-    run_worker_loop()
+    try:
+        worker_services = build_services()
+    except Exception as init_err:
+        log.exception(f"WORKER SCRIPT: Failed to initialize services: {init_err}")
+        sys.exit(f"FATAL: Could not initialize worker services: {init_err}")
+    _callback_dispatcher = CallbackDispatcher()
+    _callback_dispatcher.start()
+    try:
+        run_worker_loop(worker_services)
+    finally:
+        _callback_dispatcher.stop() # Flush callbacks still in flight before exiting
     log.info("WORKER SCRIPT: Exited run_worker_loop.")
\ No newline at end of file